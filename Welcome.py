@@ -1,15 +1,20 @@
 import streamlit as st
 from streamlit_extras.switch_page_button import switch_page
 import os
+import pandas as pd
+from data_loader import workspace_upload_folder, remove_stale_uploads
+from incremental import append_rows
+from warmup import warmup_enabled, start_warmup
 
-# Define the path to the 'uploaded_files' directory
-msaproject_path = 'uploaded_files'
-
-# Function to save uploaded file within the 'msaproject' folder structure
+# Function to save uploaded file into this workspace's own upload folder
 def save_uploaded_file(uploadedfile):
-    upload_folder = os.path.join(msaproject_path, 'uploaded_files')
+    upload_folder = workspace_upload_folder()
     if not os.path.exists(upload_folder):
         os.makedirs(upload_folder)
+    # Keep only the latest upload, so the pages always pick up the file just submitted
+    for old_file in os.listdir(upload_folder):
+        if old_file.endswith('.csv'):
+            os.remove(os.path.join(upload_folder, old_file))
     file_path = os.path.join(upload_folder, uploadedfile.name)
     with open(file_path, "wb") as f:
         f.write(uploadedfile.getbuffer())
@@ -17,6 +22,13 @@ def save_uploaded_file(uploadedfile):
 
 st.set_page_config(page_title="Segmentation and Sentiment Analysis", layout="wide")
 
+# Warm up the libraries and shared caches in the background while the first analyst reads this page
+if warmup_enabled:
+    start_warmup()
+
+# Free the disk space of workspaces nobody has opened for a while
+remove_stale_uploads()
+
 # Page header
 st.title("Segmentation and Sentiment Analysis for Women's E-commerce Clothing")
 
@@ -34,11 +46,27 @@ with col1:
 # Use the second column for Data File Uploader
 with col2:
     st.subheader("Data File Uploader")
+    upload_mode = st.radio(
+        "Upload mode:",
+        ("Replace the dataset", "Append new reviews"),
+        horizontal=True,
+        help="Appending adds only the rows not already in the active dataset, so profiles, polarity and segments "
+             "are updated for the new reviews instead of being recomputed.",
+    )
     uploaded_file = st.file_uploader("Choose a CSV file", type=["csv"], key="file_uploader")
     submit_button_pressed = False  # Button state tracking
     if uploaded_file is not None:
-        file_path = save_uploaded_file(uploaded_file)
-        st.success(f"File saved to: {file_path}")
+        if upload_mode == "Append new reviews":
+            # Append each uploaded file once, even though the page reruns on every interaction
+            upload_id = (uploaded_file.name, uploaded_file.size, uploaded_file.file_id)
+            if st.session_state.get('appended_upload', (None,))[0] != upload_id:
+                file_path, added, skipped = append_rows(pd.read_csv(uploaded_file), uploaded_file.name)
+                st.session_state['appended_upload'] = (upload_id, file_path, added, skipped)
+            _, file_path, added, skipped = st.session_state['appended_upload']
+            st.success(f"Appended {added:,} new reviews to: {file_path} ({skipped:,} already present)")
+        else:
+            file_path = save_uploaded_file(uploaded_file)
+            st.success(f"File saved to: {file_path}")
         submit_button_pressed = st.button("Submit", key="submit_btn")
 
 # Check if the submit button was pressed and an uploaded file is present
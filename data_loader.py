@@ -0,0 +1,120 @@
+import hashlib
+import os
+import re
+import shutil
+import time
+import uuid
+
+import pandas as pd
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from shared_cache import get_artifact
+
+# Define the folder the Welcome page used to save every upload into; still read when a session has no upload
+uploaded_files_folder = "uploaded_files/uploaded_files"
+
+# Define the folder holding one upload folder per workspace; the workspace token is kept in the page URL
+# (?workspace=...), so a refresh, a bookmark or a new tab on the same link finds the same uploads
+workspace_uploads_folder = "uploaded_files/workspaces"
+workspace_parameter = 'workspace'
+
+# Workspaces nobody opened for this many days are deleted, together with the per-session folders older versions wrote
+upload_retention_days = float(os.environ.get('UPLOAD_RETENTION_DAYS', '7'))
+legacy_uploads_folder = "uploaded_files/sessions"
+_last_cleanup = 0.0
+
+# Hashes already computed in this process, keyed by (path, size, modification time)
+_versions = {}
+
+
+# Function to get the workspace token of the current browser tab, creating one on its first visit
+def workspace_id():
+    if get_script_run_ctx() is None:
+        return 'default'
+    # The URL wins, so a shared link opens that workspace; session state covers page switches that drop the URL
+    token = st.query_params.get(workspace_parameter) or st.session_state.get('workspace_id')
+    if not token or not re.fullmatch(r'[A-Za-z0-9_-]{1,64}', token):
+        token = uuid.uuid4().hex
+    st.session_state['workspace_id'] = token
+    if st.query_params.get(workspace_parameter) != token:
+        st.query_params[workspace_parameter] = token
+    return token
+
+
+# Function to get the upload folder of the current workspace, marking it as still in use
+def workspace_upload_folder():
+    folder = os.path.join(workspace_uploads_folder, workspace_id())
+    if os.path.exists(folder):
+        os.utime(folder)
+    return folder
+
+
+# Function to delete the upload folders of workspaces that were not opened within the retention period
+def remove_stale_uploads(max_age_days=upload_retention_days):
+    global _last_cleanup
+    # Scanning the folders once an hour is enough
+    if time.time() - _last_cleanup < 3600:
+        return
+    _last_cleanup = time.time()
+    cutoff = time.time() - max_age_days * 86400
+    current = os.path.abspath(workspace_upload_folder())
+    for root in (workspace_uploads_folder, legacy_uploads_folder):
+        if not os.path.exists(root):
+            continue
+        for name in os.listdir(root):
+            folder = os.path.join(root, name)
+            if os.path.abspath(folder) != current and os.path.getmtime(folder) < cutoff:
+                shutil.rmtree(folder, ignore_errors=True)
+
+
+# Function to find the CSV the pages work on (the first one in the uploads folder)
+def find_uploaded_csv(folder=uploaded_files_folder):
+    if not os.path.exists(folder):
+        return None
+    csv_files = [file for file in os.listdir(folder) if file.endswith('.csv')]
+    if len(csv_files) == 0:
+        return None
+    return os.path.join(folder, csv_files[0])
+
+
+# Function to find the folder holding the most recently uploaded CSV, in any workspace or the shared uploads folder
+def latest_upload_folder(root=''):
+    folders = [os.path.join(root, uploaded_files_folder)]
+    workspaces = os.path.join(root, workspace_uploads_folder)
+    if os.path.exists(workspaces):
+        folders += [os.path.join(workspaces, name) for name in os.listdir(workspaces)]
+    uploads = [(os.path.getmtime(path), folder) for folder in folders
+               for path in [find_uploaded_csv(folder)] if path is not None]
+    return max(uploads)[1] if uploads else None
+
+
+# Function to identify a dataset by the content hash of its file
+def dataset_version(file_path):
+    stat = os.stat(file_path)
+    key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+    if key not in _versions:
+        digest = hashlib.sha1()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        _versions[key] = digest.hexdigest()[:16]
+    return _versions[key]
+
+
+# Function to find the dataset the pages work on: this workspace's own upload first, then the shared uploads folder
+def active_dataset_path(folder=None):
+    if folder is not None:
+        return find_uploaded_csv(folder)
+    return find_uploaded_csv(workspace_upload_folder()) or find_uploaded_csv(uploaded_files_folder)
+
+
+# Function to load the uploaded dataset together with its version
+def load_uploaded_data(folder=None):
+    file_path = active_dataset_path(folder)
+    if file_path is None:
+        return None, None
+    version = dataset_version(file_path)
+    # The parsed frame is shared by every session that loads the same content; each caller gets its own copy
+    data = get_artifact(('frame', version), pd.read_csv, file_path)
+    return data.copy(), version
@@ -0,0 +1,245 @@
+import json
+import os
+import shutil
+import threading
+
+import numpy as np
+import pandas as pd
+
+from data_loader import active_dataset_path, dataset_version, load_uploaded_data, workspace_upload_folder
+from shared_cache import get_artifact, peek_artifact, put_artifact
+
+# Define the file recording which dataset version was built by appending rows to which
+lineage_path = os.path.join('uploaded_files', 'lineage.json')
+
+# Drift above these levels triggers a full refit instead of assigning new rows to the saved segments
+psi_threshold = 0.2
+distance_ratio_threshold = 1.5
+
+# Distinct-count sketches use 2**14 registers per column (about 1% error)
+hll_precision = 14
+
+_lineage = None
+_lock = threading.Lock()
+
+
+# Function to read the append lineage, keeping it in memory after the first read
+def load_lineage(path=lineage_path):
+    global _lineage
+    if _lineage is None:
+        _lineage = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                _lineage = json.load(f)
+    return _lineage
+
+
+# Function to record that a dataset version is its parent version plus appended rows
+def record_append(version, parent_version, parent_rows, path=lineage_path):
+    with _lock:
+        lineage = load_lineage(path)
+        lineage[version] = {'parent': parent_version, 'parent_rows': int(parent_rows)}
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        with open(temporary_path, 'w') as f:
+            json.dump(lineage, f)
+        os.replace(temporary_path, path)
+
+
+# Function to get the parent artifact of a cached artifact and the number of rows it covers
+def parent_artifact(key):
+    # Artifact keys carry the dataset version in second place
+    lineage = load_lineage().get(key[1])
+    if lineage is None:
+        return None, 0
+    previous = peek_artifact(key[:1] + (lineage['parent'],) + key[2:])
+    if previous is None:
+        return None, 0
+    return previous, lineage['parent_rows']
+
+
+# Function to give the uploaded columns the dataset's types where no value changes (e.g. 3.0 back to 3)
+def match_dtypes(new_rows, dtypes):
+    new_rows = new_rows.copy()
+    for column, dtype in dtypes.items():
+        if new_rows[column].dtype == dtype:
+            continue
+        try:
+            converted = new_rows[column].astype(dtype)
+        except (TypeError, ValueError):
+            continue
+        if ((converted == new_rows[column]) | (converted.isna() & new_rows[column].isna())).all():
+            new_rows[column] = converted
+    return new_rows
+
+
+# Function to hash rows by value, so numbers read as int in one file and float in another still match
+def row_hashes(frame, dtypes):
+    normalised = pd.DataFrame({
+        column: frame[column].astype('float64')
+        if pd.api.types.is_numeric_dtype(dtype) and pd.api.types.is_numeric_dtype(frame[column])
+        else frame[column].astype(object)
+        for column, dtype in dtypes.items()
+    })
+    return pd.util.hash_pandas_object(normalised, index=False)
+
+
+# Function to append the rows of an uploaded CSV that the active dataset does not already contain
+def append_rows(new_rows, file_name):
+    data, parent_version = load_uploaded_data()
+    parent_path = active_dataset_path()
+    folder = workspace_upload_folder()
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, file_name)
+    if data is None:
+        new_rows.to_csv(path, index=False)
+        return path, len(new_rows), 0
+
+    # Rows already in the dataset (e.g. from a full re-export) are skipped, even when a missing
+    # value made pandas read a column of the export with a different type
+    new_rows = match_dtypes(new_rows.reindex(columns=data.columns), data.dtypes)
+    known = row_hashes(data, data.dtypes)
+    added = new_rows[~row_hashes(new_rows, data.dtypes).isin(known).to_numpy()]
+    if len(added) == 0:
+        return parent_path, 0, len(new_rows)
+
+    # Copy the current file and write only the new rows, instead of rewriting every row
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    shutil.copyfile(parent_path, temporary_path)
+    with open(temporary_path, 'rb+') as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell() > 0:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b'\n':
+                f.write(b'\n')
+    added.to_csv(temporary_path, mode='a', header=False, index=False)
+    for old_file in os.listdir(folder):
+        if old_file.endswith('.csv') and os.path.join(folder, old_file) != path:
+            os.remove(os.path.join(folder, old_file))
+    os.replace(temporary_path, path)
+
+    version = dataset_version(path)
+    record_append(version, parent_version, len(data))
+    put_artifact(('frame', version), pd.concat([data, added], ignore_index=True))
+    return path, len(added), len(new_rows) - len(added)
+
+
+# Function to count the bits of each value (vectorized int.bit_length)
+def _bit_length(values):
+    length = np.zeros(len(values), dtype=np.uint64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        high = values >= (np.uint64(1) << np.uint64(shift))
+        length += high * np.uint64(shift)
+        values = np.where(high, values >> np.uint64(shift), values)
+    return length + (values > 0)
+
+
+# Function to build a HyperLogLog sketch of the distinct values of a column
+def hll_registers(values, precision=hll_precision):
+    hashes = pd.util.hash_array(values.dropna().astype(str).to_numpy(dtype=object))
+    bucket = (hashes >> np.uint64(64 - precision)).astype(np.int64)
+    rest = hashes & np.uint64((1 << (64 - precision)) - 1)
+    rank = (np.uint64(64 - precision) - _bit_length(rest) + np.uint64(1)).astype(np.uint8)
+    registers = np.zeros(1 << precision, dtype=np.uint8)
+    np.maximum.at(registers, bucket, rank)
+    return registers
+
+
+# Function to estimate the number of distinct values from a HyperLogLog sketch
+def hll_count(registers):
+    m = len(registers)
+    estimate = 0.7213 / (1 + 1.079 / m) * m * m / np.sum(2.0 ** -registers.astype(float))
+    empty = np.count_nonzero(registers == 0)
+    # Linear counting is more accurate while many registers are still empty
+    if estimate <= 2.5 * m and empty > 0:
+        estimate = m * np.log(m / empty)
+    return int(round(estimate))
+
+
+# Function to compute mergeable profile statistics for every column of a frame
+# (the exact distinct count holds for this frame only; merged profiles fall back to the sketch)
+def column_profile(data):
+    profile = {}
+    for column in data.columns:
+        values = data[column]
+        numeric = pd.api.types.is_numeric_dtype(values)
+        profile[column] = {
+            'rows': len(values),
+            'missing': int(values.isna().sum()),
+            'sum': float(values.sum()) if numeric else None,
+            'unique': int(values.nunique()),
+            'registers': hll_registers(values),
+        }
+    return profile
+
+
+# Function to combine the profiles of two row blocks of the same dataset
+def merge_profiles(first, second):
+    merged = {}
+    for column, stats in first.items():
+        other = second[column]
+        merged[column] = {
+            'rows': stats['rows'] + other['rows'],
+            'missing': stats['missing'] + other['missing'],
+            'sum': None if stats['sum'] is None or other['sum'] is None else stats['sum'] + other['sum'],
+            'unique': None,
+            'registers': np.maximum(stats['registers'], other['registers']),
+        }
+    return merged
+
+
+# Function to profile a dataset version, only profiling the appended rows when the parent profile is cached
+def profile_dataset(key, data):
+    previous, start = parent_artifact(key)
+    if previous is None or set(previous) != set(data.columns):
+        return column_profile(data)
+    return merge_profiles(previous, column_profile(data.iloc[start:]))
+
+
+# Function to get the profile of a dataset version from the shared cache
+def get_profile(version, data):
+    key = ('profile', version)
+    return get_artifact(key, profile_dataset, key, data)
+
+
+# Function to turn a profile into the summary table shown on the data pages
+def profile_summary(profile, data):
+    return pd.DataFrame({
+        'Column': list(profile),
+        'Data Type': [str(data[column].dtype) for column in profile],
+        # Exact for a dataset profiled in one pass, estimated from the sketches for appended versions
+        'Unique Values': [hll_count(stats['registers']) if stats['unique'] is None else stats['unique']
+                          for stats in profile.values()],
+        'Missing Values': [stats['missing'] for stats in profile.values()],
+        'Mean (Numeric Columns)': [
+            'N/A' if stats['sum'] is None else round(stats['sum'] / max(stats['rows'] - stats['missing'], 1), 2)
+            for stats in profile.values()
+        ],
+    })
+
+
+# Function to compare two distributions of counts with the population stability index
+def population_stability(expected, actual):
+    expected = np.clip(expected / max(expected.sum(), 1), 1e-4, None)
+    actual = np.clip(actual / max(actual.sum(), 1), 1e-4, None)
+    return float(np.sum((actual - expected) * np.log(actual / expected)))
+
+
+# Function to measure the largest shift of any feature between the reference rows and the new rows
+def feature_drift(reference, new, bins=10):
+    reference = np.asarray(reference, dtype=float)
+    new = np.asarray(new, dtype=float)
+    drift = 0.0
+    for column in range(reference.shape[1]):
+        ref = reference[:, column][~np.isnan(reference[:, column])]
+        cur = new[:, column][~np.isnan(new[:, column])]
+        if len(ref) == 0 or len(cur) == 0:
+            continue
+        # Bins follow the reference quantiles; values outside its range fall in the outer bins
+        edges = np.unique(np.quantile(ref, np.linspace(0, 1, bins + 1)))
+        if len(edges) < 2:
+            edges = np.array([edges[0] - 0.5, edges[0] + 0.5])
+        expected = np.histogram(np.clip(ref, edges[0], edges[-1]), edges)[0]
+        actual = np.histogram(np.clip(cur, edges[0], edges[-1]), edges)[0]
+        drift = max(drift, population_stability(expected, actual))
+    return drift
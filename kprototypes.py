@@ -0,0 +1,128 @@
+import numpy as np
+import pandas as pd
+
+from shared_cache import get_artifact
+
+# Identifier columns that say nothing about a customer and are never clustered on
+id_columns = ['Unnamed: 0', 'Clothing ID']
+
+# Text columns with more distinct values than this are free text, not categories
+max_categories = 100
+
+# Rows are assigned to prototypes in chunks, so memory stays at chunk_size x k distances
+chunk_size = 8192
+
+
+# Function to pick the numeric and categorical columns to cluster on
+def mixed_columns(data):
+    columns = [column for column in data.columns if column not in id_columns]
+    numeric = [column for column in columns if pd.api.types.is_numeric_dtype(data[column])]
+    categorical = [column for column in columns
+                   if column not in numeric and data[column].nunique() <= max_categories]
+    return numeric, categorical
+
+
+# Function to standardise the numeric columns and integer-encode the categorical ones (missing values get their own code)
+def encode_mixed(data, numeric_columns, categorical_columns):
+    numeric = data[numeric_columns].astype(float)
+    numeric = numeric.fillna(numeric.mean())
+    numeric = ((numeric - numeric.mean()) / numeric.std(ddof=0).replace(0, 1)).to_numpy(dtype=np.float32)
+    codes, categories = [], {}
+    for column in categorical_columns:
+        column_codes, column_categories = pd.factorize(data[column], sort=True)
+        missing = column_codes < 0
+        if missing.any():
+            column_codes = np.where(missing, len(column_categories), column_codes)
+            column_categories = column_categories.append(pd.Index(['Missing']))
+        codes.append(column_codes)
+        categories[column] = np.asarray(column_categories, dtype=object)
+    categorical = np.stack(codes, axis=1).astype(np.int32) if codes else np.zeros((len(data), 0), dtype=np.int32)
+    return numeric, categorical, categories
+
+
+# Function to compute the mixed distance of a block of rows to every prototype:
+# squared Euclidean on the numeric part plus gamma times the number of mismatched categories
+def mixed_distances(numeric, categorical, centroids, modes, gamma):
+    distances = ((numeric ** 2).sum(axis=1)[:, None] - 2 * numeric @ centroids.T + (centroids ** 2).sum(axis=1)[None, :])
+    for column in range(categorical.shape[1]):
+        distances += gamma * (categorical[:, column][:, None] != modes[:, column][None, :])
+    return np.maximum(distances, 0)
+
+
+# Function to assign every row to its nearest prototype, a chunk of rows at a time
+def assign_prototypes(numeric, categorical, centroids, modes, gamma):
+    labels = np.empty(len(numeric), dtype=np.int64)
+    cost = 0.0
+    for start in range(0, len(numeric), chunk_size):
+        block = slice(start, start + chunk_size)
+        distances = mixed_distances(numeric[block], categorical[block], centroids, modes, gamma)
+        labels[block] = distances.argmin(axis=1)
+        cost += float(distances[np.arange(len(distances)), labels[block]].sum())
+    return labels, cost
+
+
+# Function to move every prototype to the mean (numeric) and mode (categorical) of its rows
+def update_prototypes(numeric, categorical, labels, n_clusters, n_codes, centroids, modes):
+    sizes = np.bincount(labels, minlength=n_clusters)
+    sums = np.zeros((n_clusters, numeric.shape[1]))
+    np.add.at(sums, labels, numeric)
+    occupied = sizes > 0
+    # Prototypes that lost all their rows keep their previous position
+    centroids = centroids.copy()
+    centroids[occupied] = (sums[occupied] / sizes[occupied, None]).astype(np.float32)
+    modes = modes.copy()
+    for column in range(categorical.shape[1]):
+        counts = np.bincount(labels * n_codes[column] + categorical[:, column],
+                             minlength=n_clusters * n_codes[column]).reshape(n_clusters, n_codes[column])
+        modes[occupied, column] = counts[occupied].argmax(axis=1)
+    return centroids, modes
+
+
+# Function to cluster mixed numeric and categorical rows with Huang's k-prototypes
+def kprototypes(numeric, categorical, n_clusters, gamma=None, n_init=3, max_iter=30, random_state=0):
+    # Huang's default weight: half the mean standard deviation of the (standardised) numeric columns
+    if gamma is None:
+        gamma = 0.5 * float(numeric.std(axis=0).mean()) if numeric.shape[1] else 1.0
+    n_codes = categorical.max(axis=0) + 1 if categorical.shape[1] else np.zeros(0, dtype=np.int64)
+    rng = np.random.default_rng(random_state)
+    best = None
+    for _ in range(n_init):
+        # Start from distinct random rows as prototypes
+        start = rng.choice(len(numeric), size=n_clusters, replace=False)
+        centroids, modes = numeric[start].copy(), categorical[start].copy()
+        labels = None
+        for iteration in range(max_iter):
+            new_labels, cost = assign_prototypes(numeric, categorical, centroids, modes, gamma)
+            if labels is not None and np.array_equal(new_labels, labels):
+                break
+            labels = new_labels
+            centroids, modes = update_prototypes(numeric, categorical, labels, n_clusters, n_codes, centroids, modes)
+        if best is None or cost < best['cost']:
+            best = {'labels': labels, 'centroids': centroids, 'modes': modes, 'cost': cost,
+                    'gamma': gamma, 'iterations': iteration + 1}
+    return best
+
+
+# Function to segment a frame on its numeric and categorical columns, optionally with extra numeric features
+def fit_mixed_segments(data, n_clusters, gamma=None, extra_features=None):
+    numeric_columns, categorical_columns = mixed_columns(data)
+    numeric, categorical, categories = encode_mixed(data, numeric_columns, categorical_columns)
+    if extra_features is not None:
+        numeric = np.hstack([numeric, np.asarray(extra_features, dtype=np.float32)])
+    segments = kprototypes(numeric, categorical, n_clusters, gamma)
+    segments.update(numeric_columns=numeric_columns, categorical_columns=categorical_columns, categories=categories)
+    return segments
+
+
+# Function to describe each segment by the most common value of every categorical column and its share
+def prototype_modes(segments):
+    sizes = np.bincount(segments['labels'], minlength=len(segments['modes']))
+    table = pd.DataFrame({'Cluster': np.arange(len(sizes)), 'Size': sizes})
+    for position, column in enumerate(segments['categorical_columns']):
+        table[column] = segments['categories'][column][segments['modes'][:, position]]
+    return table
+
+
+# Function to get the mixed-type segments once per dataset and settings, shared by every session
+def get_mixed_segments(key, data, n_clusters, gamma=None, extra_features=None):
+    return get_artifact(key, fit_mixed_segments, data, n_clusters, gamma, extra_features)
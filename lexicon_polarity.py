@@ -0,0 +1,238 @@
+
+import numpy as np
+import pandas as pd
+
+# Same negation words, intensity rule and "!" boost as TextBlob's pattern analyzer
+negations = ('no', 'not', "n't", 'never')
+exclamation_boost = 1.25
+
+# Lexicon arrays, built once per process on first use
+_lexicon = None
+
+
+# Function to compile TextBlob's sentiment lexicon into lookup arrays
+def load_lexicon():
+    global _lexicon
+    if _lexicon is None:
+        from textblob.en import sentiment
+        from textblob._text import (ABBREVIATIONS, EMOTICONS, PUNCTUATION, RE_ABBR1, RE_ABBR2, RE_ABBR3,
+                                    RE_EMOTICONS, RE_SARCASM)
+
+        # len() makes the lazy dictionary read en-sentiment.xml (and add the "-ly" adverbs)
+        len(sentiment)
+        words = list(dict.keys(sentiment))
+        scores = np.array([sentiment[word][None] for word in words], dtype=float)
+        modifier = np.array(['RB' in sentiment[word] for word in words])
+
+        # The extra last row stands for unknown words (get_indexer returns -1 for them)
+        _lexicon = {
+            'index': pd.Index(words),
+            'polarity': np.append(scores[:, 0], 0.0),
+            'subjectivity': np.append(scores[:, 1], 0.0),
+            'intensity': np.append(scores[:, 2], 1.0),
+            'modifier': np.append(modifier, False),
+            'ly_modifier': np.append(modifier & np.array([word.endswith('ly') for word in words]), False),
+            'emoticons': _emoticon_scores(EMOTICONS, PUNCTUATION),
+            'punctuation': PUNCTUATION,
+            'abbreviations': (ABBREVIATIONS, RE_ABBR1, RE_ABBR2, RE_ABBR3),
+            're_emoticons': RE_EMOTICONS,
+            're_sarcasm': RE_SARCASM,
+        }
+    return _lexicon
+
+
+# Function to list the emoticons TextBlob would score, with the first matching score winning
+def _emoticon_scores(emoticons, punctuation):
+    scores = {}
+    for (_, polarity), forms in emoticons.items():
+        for form in forms:
+            form = form.lower()
+            if not form.isalpha() and len(form) <= 5 and form not in punctuation:
+                scores.setdefault(form, polarity)
+    scores['(!)'] = 0.0  # sarcasm mark counts as a neutral, fully subjective assessment
+    return pd.Series(scores, dtype=float)
+
+
+# Function to split one whitespace-separated token the way TextBlob's tokenizer does: leading and trailing
+# punctuation marks become tokens of their own, but a period stays attached to abbreviations ("e.g.", "Mr.")
+# and single letters (so ":p." is not an emoticon)
+def _split_token(token):
+    lexicon = load_lexicon()
+    punctuation = lexicon['punctuation']
+    abbreviations, *abbreviation_patterns = lexicon['abbreviations']
+    head = []
+    while token and token[0] in punctuation and token[0] != '.':
+        head.append(token[0])
+        token = token[1:]
+    tail = []
+    while token and token[-1] in punctuation:
+        if token[-1] != '.':
+            tail.append(token[-1])
+            token = token[:-1]
+        elif token.endswith('...'):
+            tail.append('...')
+            token = token[:-3].rstrip('.')
+        elif token in abbreviations or any(pattern.match(token) for pattern in abbreviation_patterns):
+            break
+        else:
+            tail.append('.')
+            token = token[:-1]
+    return head + ([token] if token else []) + tail[::-1]
+
+
+# Function to tokenize a whole column of reviews: the reviews are joined into one string, so each pass runs
+# once over the column, and the punctuation rules run once per distinct token rather than once per occurrence
+def tokenize_reviews(texts):
+    lexicon = load_lexicon()
+    separator = '\x01'
+
+    reviews = texts.astype(str).str.replace(separator, '\x02', regex=False)
+    text = f' {separator} '.join(reviews).replace("n't", " n't")
+    for quote in '"\'“”‘’':
+        text = text.replace(quote, f' {quote} ')
+
+    # Split every distinct token once, then lay the pieces out again in token order
+    codes, distinct = pd.factorize(np.array(text.split(), dtype=object))
+    pieces = [_split_token(token) for token in distinct]
+    lengths = np.array([len(piece) for piece in pieces], dtype=np.int64)
+    flat = np.array([part for piece in pieces for part in piece], dtype=object)
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    counts = lengths[codes]
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    text = ' '.join(flat[np.repeat(starts[codes], counts) + offsets])
+
+    # Sarcasm marks and emoticons may span several of the pieces (": - )"), so they are joined up afterwards
+    text = lexicon['re_sarcasm'].sub('(!)', text)
+    text = lexicon['re_emoticons'].sub(lambda m: m.group(1).replace(' ', '') + m.group(2), text)
+
+    # One entry per token, labelled with the position of its review
+    tokens = np.array(text.lower().split(), dtype=object)
+    boundary = tokens == separator
+    review = np.cumsum(boundary)[~boundary]
+    return tokens[~boundary], review
+
+
+# Function to find, for every token, the latest flagged token strictly before it (-1 if none)
+def _last_before(flags, positions):
+    last = np.maximum.accumulate(np.where(flags, positions, -1))
+    return np.concatenate(([-1], last[:-1]))
+
+
+# Function to score a column of reviews with the compiled lexicon, matching TextBlob's polarity
+def score_lexicon(texts):
+    lexicon = load_lexicon()
+    texts = texts.astype(str)
+    n_reviews = len(texts)
+
+    tokens, review = tokenize_reviews(texts)
+    if len(tokens) == 0:
+        return pd.DataFrame({'polarity': 0.0, 'subjectivity': 0.0}, index=texts.index)
+
+    positions = np.arange(len(tokens))
+    is_first = np.concatenate(([True], review[1:] != review[:-1]))
+    review_start = np.maximum.accumulate(np.where(is_first, positions, 0))
+
+    # Token properties are looked up once per distinct token, then spread over the occurrences
+    token_codes, distinct = pd.factorize(tokens)
+    distinct = pd.Series(distinct, dtype=object)
+    codes = lexicon['index'].get_indexer(distinct)[token_codes]
+    known = codes >= 0
+    polarity = lexicon['polarity'][codes]
+    subjectivity = lexicon['subjectivity'][codes]
+    intensity = lexicon['intensity'][codes]
+    modifier = lexicon['modifier'][codes]
+    ly_modifier = lexicon['ly_modifier'][codes]
+
+    length = distinct.str.len().to_numpy()[token_codes]
+    stripped_length = distinct.str.strip("'").str.len().to_numpy()[token_codes]
+    negation = distinct.isin(negations).to_numpy()[token_codes]
+
+    # Latest known word before each token in the same review ("really" in "really good")
+    last_known = _last_before(known, positions)
+    has_last_known = last_known >= review_start
+    last_known = np.where(has_last_known, last_known, 0)
+    after_modifier = has_last_known & modifier[last_known]
+    after_ly_modifier = has_last_known & ly_modifier[last_known]
+
+    # A modifier carries over small words only; a negation after a "-ly" modifier keeps it alive
+    breaks_modifier = ~known & (length > 2) & ~(negation & after_ly_modifier)
+    modifier_active = after_modifier & (_last_before(breaks_modifier, positions) < last_known)
+
+    # "really not good": the negation is folded into the modifier's assessment instead
+    absorbed_negation = ~known & negation & modifier_active & after_ly_modifier
+    sets_negation = negation & ~absorbed_negation
+    clears_negation = (~negation & (known | (stripped_length > 1))) | absorbed_negation
+    last_negation = _last_before(sets_negation, positions)
+    negated = (last_negation >= review_start) & (last_negation > _last_before(clears_negation, positions))
+
+    # Emoticons and the sarcasm mark open an assessment of their own
+    emoticon_polarity = distinct.map(lexicon['emoticons']).to_numpy(dtype=float)[token_codes]
+    emoticon = ~known & ~np.isnan(emoticon_polarity)
+    polarity = np.where(emoticon, emoticon_polarity, polarity)
+    subjectivity = np.where(emoticon, 1.0, subjectivity)
+
+    # Known words either open a new assessment or are merged into the latest one
+    merged = known & modifier_active
+    contributes = known | emoticon
+    starts = contributes & ~merged
+    assessment = np.cumsum(starts) - 1
+    n_assessments = int(starts.sum())
+
+    # A merged word is scaled by the intensity of the word merged just before it
+    last_contributor = _last_before(contributes, positions)
+    last_contributor = np.where(last_contributor >= review_start, last_contributor, 0)
+    effective_intensity = np.where(known & negated, 1.0 / intensity, intensity)
+    scale = effective_intensity[last_contributor]
+    polarity = np.where(merged, np.clip(polarity * scale, -1.0, 1.0), polarity)
+    subjectivity = np.where(merged, np.clip(subjectivity * scale, -1.0, 1.0), subjectivity)
+
+    # An assessment takes the scores of its last contributing token
+    contributor_positions = np.flatnonzero(contributes)
+    contributor_assessment = assessment[contributor_positions]
+    is_last = np.ones(len(contributor_positions), dtype=bool)
+    is_last[:-1] = contributor_assessment[1:] != contributor_assessment[:-1]
+    last_token = contributor_positions[is_last]
+    assessment_polarity = polarity[last_token]
+    assessment_subjectivity = subjectivity[last_token]
+    assessment_review = review[last_token]
+
+    # Exclamation marks boost the latest assessment unless another word is merged into it later
+    exclamation = (tokens == '!') & (_last_before(starts, positions) >= review_start)
+    exclamation[exclamation] &= positions[exclamation] > last_token[assessment[exclamation]]
+    boosts = np.bincount(assessment[exclamation], minlength=n_assessments)
+    assessment_polarity = np.clip(assessment_polarity * exclamation_boost ** boosts, -1.0, 1.0)
+
+    # "not good" = slightly bad, "not bad" = slightly good
+    flips = (known & negated) | absorbed_negation
+    is_negated = np.bincount(assessment[flips], minlength=n_assessments) > 0
+    assessment_polarity = np.where(is_negated, assessment_polarity * -0.5, assessment_polarity)
+
+    polarity_sum = np.bincount(assessment_review, assessment_polarity, minlength=n_reviews)
+    subjectivity_sum = np.bincount(assessment_review, assessment_subjectivity, minlength=n_reviews)
+    count = np.bincount(assessment_review, minlength=n_reviews)
+
+    denominator = np.maximum(count, 1)
+    return pd.DataFrame(
+        {'polarity': polarity_sum / denominator, 'subjectivity': subjectivity_sum / denominator},
+        index=texts.index,
+    )
+
+
+# Function to compare the lexicon engine with TextBlob on a sample of reviews
+def parity_report(texts, tolerance=1e-6):
+    from textblob import TextBlob
+
+    texts = texts.astype(str)
+    fast = score_lexicon(texts)
+    reference = pd.DataFrame(
+        [tuple(TextBlob(text).sentiment) for text in texts],
+        columns=['polarity', 'subjectivity'],
+        index=texts.index,
+    )
+    difference = (fast - reference).abs()
+    return {
+        'reviews': len(texts),
+        'max_polarity_difference': difference['polarity'].max(),
+        'max_subjectivity_difference': difference['subjectivity'].max(),
+        'share_within_tolerance': (difference.max(axis=1) <= tolerance).mean(),
+    }
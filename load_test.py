@@ -0,0 +1,357 @@
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+import uuid
+
+import numpy as np
+
+from data_loader import workspace_uploads_folder, workspace_parameter, latest_upload_folder, find_uploaded_csv
+
+# Seconds to wait for a started server to answer its health check, and for a single interaction
+startup_timeout = 60
+interaction_timeout = 600
+
+# How often the server's CPU time and resident memory are sampled
+sample_interval = 0.2
+
+app_folder = os.path.dirname(os.path.abspath(__file__))
+
+
+# Function to list a process and all its descendants (e.g. the sentiment and joblib worker pools)
+def process_tree(pid):
+    parents = {}
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            try:
+                with open(f'/proc/{entry}/stat') as f:
+                    parents[int(entry)] = int(f.read().rsplit(')', 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+    tree, frontier = [pid], [pid]
+    while frontier:
+        frontier = [child for child, parent in parents.items() if parent in frontier]
+        tree.extend(frontier)
+    return tree
+
+
+# Function to add up the CPU seconds and resident memory of a group of processes (Linux /proc)
+def process_usage(pids):
+    ticks, page_size = os.sysconf('SC_CLK_TCK'), os.sysconf('SC_PAGE_SIZE')
+    cpu, memory = 0.0, 0
+    for pid in pids:
+        try:
+            with open(f'/proc/{pid}/stat') as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+            with open(f'/proc/{pid}/statm') as f:
+                memory += int(f.read().split()[1]) * page_size
+        except (OSError, IndexError, ValueError):
+            continue
+        # utime, stime, and the time of children that already exited
+        cpu += sum(int(value) for value in fields[11:15]) / ticks
+    return cpu, memory
+
+
+# Function to sample the server's CPU time and memory in the background until the run stops
+def monitor_server(pid, samples, stop):
+    while not stop.is_set():
+        samples.append((time.perf_counter(),) + process_usage(process_tree(pid)))
+        stop.wait(sample_interval)
+
+
+# Function to start the app on a local port and wait until it answers
+def start_server(port):
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'streamlit', 'run', 'Welcome.py', '--server.headless', 'true',
+         '--server.port', str(port), '--browser.gatherUsageStats', 'false'],
+        cwd=app_folder, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.perf_counter() + startup_timeout
+    while time.perf_counter() < deadline:
+        try:
+            with urllib.request.urlopen(f'http://localhost:{port}/_stcore/health', timeout=1) as response:
+                if response.status == 200:
+                    return server
+        except OSError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError(f"The app did not start on port {port} within {startup_timeout}s.")
+
+
+# Function to open a websocket session with the app, like a browser tab does
+async def connect(url):
+    from tornado.websocket import websocket_connect
+
+    websocket = await websocket_connect(url.replace('http', 'ws', 1).rstrip('/') + '/_stcore/stream',
+                                        max_message_size=1 << 30)
+    # The handshake sets the XSRF cookie the file upload requests must echo back
+    cookies = [header.split(';', 1)[0].split('=', 1) for header in websocket.headers.get_list('Set-Cookie')]
+    # Each simulated tab works in its own workspace, passed in the URL like a browser would
+    return {'websocket': websocket, 'url': url.rstrip('/'), 'xsrf': dict(cookies).get('_streamlit_xsrf'),
+            'workspace': f"loadtest-{uuid.uuid4().hex}", 'session_id': '', 'pages': {}, 'page': '',
+            'widgets': {}, 'values': {}}
+
+
+# Function to rerun a page of the session with its widget values, reading messages until the run finishes
+async def rerun(session, page=None, triggers=()):
+    from streamlit.proto.BackMsg_pb2 import BackMsg
+    from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+    if page is not None:
+        session['page'] = session['pages'][page]
+        session['values'] = {}
+    message = BackMsg()
+    message.rerun_script.query_string = f"{workspace_parameter}={session['workspace']}"
+    message.rerun_script.page_script_hash = session['page']
+    message.rerun_script.widget_states.widgets.extend(list(session['values'].values()) + list(triggers))
+    await session['websocket'].write_message(message.SerializeToString(), binary=True)
+
+    session['widgets'], errors = {}, []
+    while True:
+        data = await asyncio.wait_for(session['websocket'].read_message(), interaction_timeout)
+        if data is None:
+            raise ConnectionError("The app closed the session.")
+        reply = ForwardMsg()
+        reply.ParseFromString(data)
+        kind = reply.WhichOneof('type')
+        if kind == 'new_session':
+            # A script run starts (e.g. the page a button switched to), so only its widgets are kept
+            session['session_id'], session['widgets'] = reply.new_session.initialize.session_id, {}
+            session['pages'] = {page.page_name: page.page_script_hash for page in reply.new_session.app_pages}
+            session['page'] = reply.new_session.page_script_hash
+        elif kind == 'delta' and reply.delta.WhichOneof('type') == 'new_element':
+            element = reply.delta.new_element
+            element_type = element.WhichOneof('type')
+            if element_type == 'exception':
+                errors.append(element.exception.message)
+            else:
+                widget = getattr(element, element_type)
+                if hasattr(widget, 'id') and getattr(widget, 'label', ''):
+                    session['widgets'][widget.label] = widget
+        elif kind == 'script_finished' and reply.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+            return errors
+
+
+# Function to set a slider, select box or radio widget by its label and rerun
+async def set_widget(session, label, value):
+    from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+    widget = session['widgets'][label]
+    state = WidgetState(id=widget.id)
+    if hasattr(widget, 'options') and len(widget.options):
+        state.int_value = list(widget.options).index(value)
+    else:
+        state.double_array_value.data.append(value)
+    session['values'][widget.id] = state
+    return await rerun(session)
+
+
+# Function to click a button by its label
+async def click(session, label):
+    from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+    return await rerun(session, triggers=[WidgetState(id=session['widgets'][label].id, trigger_value=True)])
+
+
+# Function to ask the app where to upload a file, as the file uploader widget does before sending it
+async def upload_urls(session, file_name):
+    from streamlit.proto.BackMsg_pb2 import BackMsg
+    from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+    message = BackMsg()
+    message.file_urls_request.request_id = uuid.uuid4().hex
+    message.file_urls_request.session_id = session['session_id']
+    message.file_urls_request.file_names.append(file_name)
+    await session['websocket'].write_message(message.SerializeToString(), binary=True)
+    while True:
+        data = await asyncio.wait_for(session['websocket'].read_message(), interaction_timeout)
+        if data is None:
+            raise ConnectionError("The app closed the session.")
+        reply = ForwardMsg()
+        reply.ParseFromString(data)
+        if reply.WhichOneof('type') == 'file_urls_response':
+            if reply.file_urls_response.error_msg:
+                raise RuntimeError(reply.file_urls_response.error_msg)
+            return reply.file_urls_response.file_urls[0]
+
+
+# Function to upload a CSV through the Welcome page's file uploader: send the file to the app's upload
+# endpoint, then rerun with the widget pointing at it, so the page saves it with save_uploaded_file
+async def upload(session, dataset):
+    from tornado.httpclient import AsyncHTTPClient
+    from streamlit.proto.Common_pb2 import FileUploaderState, UploadedFileInfo
+    from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+    errors = await rerun(session)
+    if errors:
+        return errors
+    file_name = os.path.basename(dataset)
+    with open(dataset, 'rb') as f:
+        content = f.read()
+    urls = await upload_urls(session, file_name)
+
+    boundary = uuid.uuid4().hex
+    body = (f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{file_name}"\r\n'
+            f'Content-Type: text/csv\r\n\r\n').encode() + content + f'\r\n--{boundary}--\r\n'.encode()
+    headers = {'Content-Type': f'multipart/form-data; boundary={boundary}'}
+    if session['xsrf']:
+        headers.update({'Cookie': f"_streamlit_xsrf={session['xsrf']}", 'X-Xsrftoken': session['xsrf']})
+    await AsyncHTTPClient().fetch(session['url'] + urls.upload_url, method='PUT', headers=headers, body=body,
+                                  request_timeout=interaction_timeout)
+
+    state = WidgetState(id=session['widgets']["Choose a CSV file"].id)
+    state.file_uploader_state_value.CopyFrom(FileUploaderState(uploaded_file_info=[
+        UploadedFileInfo(name=file_name, size=len(content), file_id=urls.file_id, file_urls=urls)]))
+    session['values'][state.id] = state
+    return await rerun(session)
+
+
+# Function to build the scripted page flow of one session: upload and submit, page 3, clustering on page 4, page 5
+def page_flow(dataset, number):
+    num_clusters = 2 + number % 4
+    return [
+        ('upload', lambda session: upload(session, dataset)),
+        # Submit switches to page 2, which then profiles the upload
+        ('submit (page2 open)', lambda session: click(session, "Submit")),
+        ('page3 open', lambda session: rerun(session, 'page3_CleanData')),
+        ('page4 open', lambda session: rerun(session, 'page4_Modelling')),
+        ('page4 set k', lambda session: set_widget(session, "Select the number of clusters (k):", num_clusters)),
+        ('page4 k-means', lambda session: click(session, "Perform Clustering")),
+        ('page4 DBSCAN', lambda session: set_widget(session, "Choose a clustering model:", "DBSCAN")),
+        ('page4 DBSCAN fit', lambda session: click(session, "Perform Clustering")),
+        ('page5 open', lambda session: rerun(session, 'page5_SentimentAnalysis')),
+        ('page5 vectorized engine', lambda session: set_widget(session, "Sentiment engine:", "Vectorized lexicon")),
+    ]
+
+
+# Function to run the page flow of one simulated session, timing every interaction
+async def run_session(url, dataset, number, iterations, think_time, start_delay, results):
+    await asyncio.sleep(start_delay)
+    for _ in range(iterations):
+        session = await connect(url)
+        try:
+            for name, interaction in page_flow(dataset, number):
+                start = time.perf_counter()
+                try:
+                    errors = await interaction(session)
+                except Exception as error:
+                    errors = [f"{type(error).__name__}: {error}"]
+                results.append({'session': number, 'interaction': name,
+                                'seconds': time.perf_counter() - start, 'errors': errors})
+                if errors:
+                    break
+                await asyncio.sleep(think_time)
+        finally:
+            session['websocket'].close()
+            # Leave no simulated uploads behind in the app's upload folders
+            shutil.rmtree(os.path.join(app_folder, workspace_uploads_folder, session['workspace']), ignore_errors=True)
+
+
+# Function to drive concurrent sessions against the app and collect latencies, throughput, CPU and memory
+def load_test(dataset, sessions=4, iterations=1, think_time=0.0, ramp_up=0.0, url=None, port=8599, pid=None):
+    server = None
+    if url is None:
+        server = start_server(port)
+        url, pid = f'http://localhost:{port}', server.pid
+
+    samples, stop = [], threading.Event()
+    if pid is not None:
+        monitor = threading.Thread(target=monitor_server, args=(pid, samples, stop), daemon=True)
+        monitor.start()
+
+    async def run_all():
+        await asyncio.gather(*[
+            run_session(url, dataset, number, iterations, think_time, ramp_up * number / max(sessions - 1, 1), results)
+            for number in range(sessions)
+        ])
+
+    results = []
+    wall_start = time.perf_counter()
+    try:
+        asyncio.run(run_all())
+    finally:
+        wall = time.perf_counter() - wall_start
+        stop.set()
+        if server is not None:
+            server.terminate()
+            server.wait()
+    return summarise(results, wall, samples, sessions)
+
+
+# Function to turn the raw timings and samples into per-interaction percentiles and overall figures
+def summarise(results, wall, samples, sessions):
+    interactions = {}
+    for name in dict.fromkeys(result['interaction'] for result in results):
+        timings = [result for result in results if result['interaction'] == name]
+        seconds = np.array([result['seconds'] for result in timings])
+        interactions[name] = {
+            'count': len(seconds),
+            'errors': sum(bool(result['errors']) for result in timings),
+            'p50': float(np.percentile(seconds, 50)),
+            'p90': float(np.percentile(seconds, 90)),
+            'p95': float(np.percentile(seconds, 95)),
+            'p99': float(np.percentile(seconds, 99)),
+            'max': float(seconds.max()),
+        }
+    report = {
+        'sessions': sessions,
+        'interactions': interactions,
+        'total_interactions': len(results),
+        'wall_seconds': wall,
+        'throughput_per_second': len(results) / wall if wall else 0.0,
+        'errors': [f"session {result['session']} {result['interaction']}: {error}"
+                   for result in results for error in result['errors']],
+    }
+    if len(samples) > 1:
+        times, cpu, memory = (np.array(values) for values in zip(*samples))
+        report['cpu_seconds'] = float(cpu.max() - cpu[0])
+        report['cpu_utilisation'] = report['cpu_seconds'] / (times[-1] - times[0]) / (os.cpu_count() or 1)
+        report['rss_peak_mb'] = float(memory.max()) / 2 ** 20
+        report['rss_end_mb'] = float(memory[-1]) / 2 ** 20
+    return report
+
+
+# Function to print a report as a table
+def print_report(report):
+    print(f"{report['sessions']} sessions, {report['total_interactions']} interactions in {report['wall_seconds']:.1f}s "
+          f"({report['throughput_per_second']:.2f}/s)")
+    print(f"{'interaction':26s} {'count':>5s} {'errors':>6s} {'p50':>7s} {'p90':>7s} {'p95':>7s} {'p99':>7s} {'max':>7s}")
+    for name, stats in report['interactions'].items():
+        print(f"{name:26s} {stats['count']:5d} {stats['errors']:6d} " +
+              " ".join(f"{stats[key]:7.2f}" for key in ('p50', 'p90', 'p95', 'p99', 'max')))
+    if 'cpu_seconds' in report:
+        print(f"Server CPU {report['cpu_seconds']:.1f}s ({report['cpu_utilisation']:.0%} of {os.cpu_count()} cores), "
+              f"RSS peak {report['rss_peak_mb']:.0f} MB, end {report['rss_end_mb']:.0f} MB")
+    for error in report['errors'][:10]:
+        print(error)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Drive simulated browser sessions through the app's page flow.")
+    parser.add_argument('--sessions', type=int, default=4, help="number of simultaneous sessions")
+    parser.add_argument('--iterations', type=int, default=1, help="times each session repeats the page flow")
+    parser.add_argument('--dataset', help="CSV each session uploads (defaults to the latest upload)")
+    parser.add_argument('--think-time', type=float, default=0.0, help="seconds a session waits between interactions")
+    parser.add_argument('--ramp-up', type=float, default=0.0, help="seconds over which the sessions are started")
+    parser.add_argument('--url', help="test an app that is already running instead of starting one")
+    parser.add_argument('--pid', type=int, help="process id of that app, to sample its CPU and memory")
+    parser.add_argument('--port', type=int, default=8599, help="port for the app started by the harness")
+    parser.add_argument('--json', help="also write the report to this file")
+    args = parser.parse_args()
+
+    folder = latest_upload_folder(app_folder)
+    dataset = args.dataset or (find_uploaded_csv(folder) if folder is not None else None)
+    if dataset is None:
+        sys.exit("No CSV to upload: pass --dataset or put one in the 'uploaded_files' folder.")
+    report = load_test(os.path.abspath(dataset), args.sessions, args.iterations, args.think_time, args.ramp_up,
+                       args.url, args.port, args.pid)
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
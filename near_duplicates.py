@@ -0,0 +1,137 @@
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from shared_cache import get_artifact
+
+# Defaults for the MinHash signatures: number of hash functions, words per shingle and similarity threshold
+num_perm = 128
+shingle_size = 3
+default_threshold = 0.8
+
+# Reviews hashed per step, so the (shingles x hash functions) block stays around 100 MB
+chunk_size = 2000
+
+_mersenne_prime = np.uint64((1 << 61) - 1)
+_max_hash = np.uint64((1 << 32) - 1)
+
+
+# Function to hash every review into word shingles, returning (review position, shingle hash) pairs
+def shingle_hashes(texts, shingle_size=shingle_size):
+    words = texts.fillna('').astype(str).str.lower().str.findall(r"[a-z0-9']+")
+    flat = words.explode().dropna()
+    review = flat.index.to_numpy()
+    word_hash = pd.util.hash_array(flat.to_numpy(dtype=object))
+
+    # A shingle is a run of consecutive words in the same review, folded into one hash
+    shingle = word_hash.copy()
+    complete = np.ones(len(review), dtype=bool)
+    for k in range(1, shingle_size):
+        within = np.zeros(len(review), dtype=bool)
+        within[:-k] = review[k:] == review[:-k]
+        next_hash = np.zeros_like(word_hash)
+        next_hash[:-k] = word_hash[k:]
+        shingle = np.where(within, shingle * np.uint64(1000003) ^ next_hash, shingle)
+        complete &= within
+    # Reviews shorter than a shingle keep their whole text as a single shingle
+    lengths = np.bincount(review, minlength=len(texts))
+    first = np.ones(len(review), dtype=bool)
+    first[1:] = review[1:] != review[:-1]
+    keep = complete | (first & (lengths[review] < shingle_size))
+    return review[keep], shingle[keep]
+
+
+# Function to compute MinHash signatures (one row per review) from the shingle hashes
+def minhash_signatures(n_reviews, review, shingles, num_perm=num_perm, seed=0):
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, 1 << 32, size=num_perm, dtype=np.uint64)
+    b = rng.integers(0, 1 << 32, size=num_perm, dtype=np.uint64)
+    shingles = shingles & _max_hash
+
+    signatures = np.full((n_reviews, num_perm), _max_hash, dtype=np.uint64)
+    boundaries = np.searchsorted(review, np.arange(0, n_reviews + chunk_size, chunk_size))
+    for start, end in zip(boundaries[:-1], boundaries[1:]):
+        if start == end:
+            continue
+        chunk_review = review[start:end]
+        hashed = ((shingles[start:end, None] * a + b) % _mersenne_prime) & _max_hash
+        # Shingles are grouped by review, so a segmented minimum gives each review's signature
+        segment_starts = np.flatnonzero(np.concatenate(([True], chunk_review[1:] != chunk_review[:-1])))
+        signatures[chunk_review[segment_starts]] = np.minimum.reduceat(hashed, segment_starts, axis=0)
+    return signatures
+
+
+# Function to pick LSH bands x rows so that pairs above the threshold are likely to share a bucket
+def lsh_bands(threshold, num_perm=num_perm):
+    options = [(num_perm // rows, rows) for rows in range(1, num_perm + 1) if num_perm % rows == 0]
+    return min(options, key=lambda option: abs((1.0 / option[0]) ** (1.0 / option[1]) - threshold))
+
+
+# Function to group near-duplicate reviews; returns a group id per review (-1 for reviews with no duplicate)
+def find_duplicate_groups(texts, threshold=default_threshold, num_perm=num_perm, seed=0):
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+
+    n_reviews = len(texts)
+    review, shingles = shingle_hashes(texts.reset_index(drop=True))
+    signatures = minhash_signatures(n_reviews, review, shingles, num_perm, seed)
+    has_text = np.bincount(review, minlength=n_reviews) > 0
+    candidates = np.flatnonzero(has_text)
+
+    n_bands, rows = lsh_bands(threshold, num_perm)
+    left, right = [], []
+    for band in range(n_bands):
+        band_hash = np.zeros(len(candidates), dtype=np.uint64)
+        for column in range(band * rows, (band + 1) * rows):
+            band_hash = band_hash * np.uint64(1000003) ^ signatures[candidates, column]
+        # Link every review in a bucket to the bucket's first review
+        order = np.argsort(band_hash, kind='stable')
+        sorted_hash = band_hash[order]
+        new_bucket = np.concatenate(([True], sorted_hash[1:] != sorted_hash[:-1]))
+        bucket_first = order[np.maximum.accumulate(np.where(new_bucket, np.arange(len(order)), 0))]
+        linked = ~new_bucket
+        left.append(candidates[bucket_first[linked]])
+        right.append(candidates[order[linked]])
+
+    left = np.concatenate(left) if left else np.array([], dtype=np.int64)
+    right = np.concatenate(right) if right else np.array([], dtype=np.int64)
+    pairs = np.unique(np.stack([left, right], axis=1), axis=0) if len(left) else np.empty((0, 2), dtype=np.int64)
+
+    # Keep candidate pairs whose estimated Jaccard similarity reaches the threshold
+    similarity = (signatures[pairs[:, 0]] == signatures[pairs[:, 1]]).mean(axis=1) if len(pairs) else np.array([])
+    pairs = pairs[similarity >= threshold]
+
+    graph = coo_matrix((np.ones(len(pairs)), (pairs[:, 0], pairs[:, 1])), shape=(n_reviews, n_reviews))
+    _, component = connected_components(graph, directed=False)
+    sizes = np.bincount(component)
+    groups = np.where(sizes[component] > 1, component, -1)
+    return pd.Series(groups, index=texts.index, name='Duplicate Group')
+
+
+# Function to find duplicate groups once per dataset version and threshold, shared by every session
+def get_duplicate_groups(version, threshold, texts):
+    with st.spinner("Looking for near-duplicate reviews..."):
+        return get_artifact(('duplicate_groups', version, threshold), find_duplicate_groups, texts, threshold)
+
+
+# Function to keep only the first review of every near-duplicate group (call it on the full loaded dataset)
+def drop_near_duplicates(data, version, threshold=default_threshold):
+    groups = get_duplicate_groups(version, threshold, data['Review Text'])
+    keep = (groups == -1) | ~groups.duplicated()
+    return data[keep.to_numpy()].copy()
+
+
+# Function to show the dedup switch in the sidebar; the choice is shared by every page of the session
+def near_duplicate_settings():
+    enabled = st.sidebar.checkbox(
+        "Remove near-duplicate reviews",
+        value=st.session_state.get('dedupe_reviews', False),
+        help="Reposted and templated reviews are detected with MinHash/LSH and only the first copy is kept.",
+    )
+    threshold = st.sidebar.slider(
+        "Near-duplicate similarity threshold:", min_value=0.5, max_value=1.0, step=0.05,
+        value=st.session_state.get('dedupe_threshold', default_threshold), disabled=not enabled,
+    )
+    st.session_state['dedupe_reviews'] = enabled
+    st.session_state['dedupe_threshold'] = threshold
+    return enabled, threshold
@@ -0,0 +1,122 @@
+import os
+import pickle
+
+import numpy as np
+import streamlit as st
+
+from shared_cache import get_artifact
+from text_features import get_text_components, combine_features
+
+# Define the folder the persisted indexes are written to, next to the keyword indexes
+index_folder = os.path.join('uploaded_files', 'indexes')
+
+# Up to this many dimensions an exact KD-tree is fast; above it an inverted-file index is used
+max_tree_dimensions = 20
+
+# Number of inverted lists searched per query, and the most lists an index is split into
+n_probe = 16
+max_lists = 4096
+
+# Identifier and derived columns that say nothing about how similar two customers are
+excluded_columns = ['Unnamed: 0', 'Clothing ID', 'Cluster', 'polarity']
+
+
+# Function to standardise the numeric columns describing a customer, filling gaps with the column mean
+def customer_features(data):
+    features = data.select_dtypes(include=[np.number])
+    features = features.drop(columns=[column for column in excluded_columns if column in features.columns])
+    features = features.fillna(features.mean())
+    scale = features.std(ddof=0).replace(0, 1)
+    return ((features - features.mean()) / scale).to_numpy(dtype=np.float32)
+
+
+# Function to build an exact KD-tree over low-dimensional vectors
+def build_tree_index(vectors):
+    from scipy.spatial import cKDTree
+
+    return {'kind': 'tree', 'tree': cKDTree(vectors, leafsize=32)}
+
+
+# Function to build an inverted-file index: vectors are bucketed by their nearest coarse centroid
+def build_ivf_index(vectors, random_state=0):
+    from sklearn.cluster import MiniBatchKMeans
+
+    n_lists = int(np.clip(np.sqrt(len(vectors)), 1, max_lists))
+    quantizer = MiniBatchKMeans(n_clusters=n_lists, random_state=random_state, batch_size=4096, n_init=3)
+    lists = quantizer.fit_predict(vectors)
+    order = np.argsort(lists, kind='stable')
+    return {
+        'kind': 'ivf',
+        'centroids': quantizer.cluster_centers_.astype(np.float32),
+        'offsets': np.searchsorted(lists[order], np.arange(n_lists + 1)),
+        'order': order.astype(np.int64),
+        'vectors': np.ascontiguousarray(vectors, dtype=np.float32),
+    }
+
+
+# Function to pick the index type from the number of dimensions
+def build_neighbour_index(vectors):
+    if vectors.shape[1] <= max_tree_dimensions:
+        return build_tree_index(vectors)
+    return build_ivf_index(vectors)
+
+
+# Function to load a neighbour index for a dataset version from disk, building and saving it the first time
+def load_neighbour_index(version, name, compute_vectors, folder=index_folder):
+    path = os.path.join(folder, f"{version}-{name}.neighbours.pkl")
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    index = build_neighbour_index(compute_vectors())
+    os.makedirs(folder, exist_ok=True)
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    with open(temporary_path, 'wb') as f:
+        pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temporary_path, path)
+    return index
+
+
+# Function to find the k rows closest to a given row, returning (row positions, distances)
+def nearest_neighbours(index, row, k=10):
+    if index['kind'] == 'tree':
+        tree = index['tree']
+        # One extra row, since the row itself is usually its own nearest neighbour
+        query_size = min(k + 1, tree.n)
+        distances, rows = tree.query(tree.data[row], k=query_size)
+        distances, rows = np.atleast_1d(distances), np.atleast_1d(rows)
+    else:
+        query = index['vectors'][row]
+        # Search the lists whose centroids are closest to the query, then rank their rows exactly
+        centroid_distances = ((index['centroids'] - query) ** 2).sum(axis=1)
+        probed = np.argsort(centroid_distances)[:n_probe]
+        offsets = index['offsets']
+        candidates = np.concatenate([index['order'][offsets[i]:offsets[i + 1]] for i in probed])
+        candidate_distances = np.sqrt(((index['vectors'][candidates] - query) ** 2).sum(axis=1))
+        top = np.argsort(candidate_distances)[:k + 1]
+        rows, distances = candidates[top], candidate_distances[top]
+    keep = rows != row
+    return rows[keep][:k], distances[keep][:k]
+
+
+# Function to list the most similar rows that are still in the (possibly filtered) frame
+def similar_rows(index, data, row, k=10):
+    rows, distances = nearest_neighbours(index, row, k * 3)
+    keep = np.isin(rows, data.index.to_numpy())
+    rows, distances = rows[keep][:k], distances[keep][:k]
+    similar = data.loc[rows].copy()
+    similar.insert(0, 'Distance', distances.round(3))
+    return similar
+
+
+# Function to get the neighbour index over customers (optionally with their review text) or over reviews
+def get_neighbour_index(version, name, data):
+    def compute_vectors():
+        if name == 'reviews':
+            return get_text_components(version, data['Review Text'])
+        vectors = customer_features(data)
+        if name == 'customers+text':
+            vectors = combine_features(vectors, get_text_components(version, data['Review Text']))
+        return vectors
+
+    with st.spinner("Indexing similar rows..."):
+        return get_artifact(('neighbours', version, name), load_neighbour_index, version, name, compute_vectors)
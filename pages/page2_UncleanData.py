@@ -2,7 +2,8 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 from streamlit_extras.switch_page_button import switch_page
-import os
+from data_loader import load_uploaded_data
+from incremental import get_profile, profile_summary
 
 # Function to plot histograms
 def plot_histograms(data, column):
@@ -29,40 +30,21 @@ def plot_boxplot(data, column):
     return fig
 
 # Function to display data summary
-def display_data_summary(data):
+def display_data_summary(data, version):
     st.write(f"### Count before dropping NA: {len(data)}")
     
-    summary_data = {
-        'Column': [],
-        'Data Type': [],
-        'Unique Values': [],
-        'Missing Values': [],
-        'Mean (Numeric Columns)': []
-    }
-    for col in data.columns:
-        summary_data['Column'].append(col)
-        summary_data['Data Type'].append(data[col].dtype)
-        summary_data['Unique Values'].append(data[col].nunique())
-        summary_data['Missing Values'].append(data[col].isna().sum())
-        if pd.api.types.is_numeric_dtype(data[col]):
-            summary_data['Mean (Numeric Columns)'].append(round(data[col].mean(), 2))
-        else:
-            summary_data['Mean (Numeric Columns)'].append('N/A')
-    summary_df = pd.DataFrame(summary_data)
+    # Counts, sums and distinct-value sketches are kept per dataset version and only
+    # computed for the new rows when reviews were appended to an earlier version
+    summary_df = profile_summary(get_profile(version, data), data)
     return summary_df
 
 if __name__ == "__main__":
-    # Load data
-    uploaded_files_folder = "uploaded_files/uploaded_files"
-    files = os.listdir(uploaded_files_folder)
-    csv_files = [file for file in files if file.endswith('.csv')]
+    # Load data (this workspace's upload, or the first CSV file in the uploaded_files folder)
+    data, data_version = load_uploaded_data()
     
-    if len(csv_files) == 0:
+    if data is None:
         st.warning("No CSV files found in the 'uploaded_files' folder.")
-    else:
-        # Automatically select the first CSV file found
-        file_path = os.path.join(uploaded_files_folder, csv_files[0])
-        data = pd.read_csv(file_path)
+        st.stop()
 
     if 'Unnamed: 0' in data.columns:
         data.drop(columns=['Unnamed: 0'], inplace=True)
@@ -77,7 +59,7 @@ if __name__ == "__main__":
 
     with left_column:
         st.subheader('Data Summary')
-        summary_df = display_data_summary(data)
+        summary_df = display_data_summary(data, data_version)
         # Displaying DataFrame without scroll bars
         st.table(summary_df)
         
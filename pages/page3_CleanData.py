@@ -2,10 +2,21 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 from streamlit_extras.switch_page_button import switch_page
-import os
+from data_loader import load_uploaded_data
+from near_duplicates import near_duplicate_settings, drop_near_duplicates
+from review_cube import get_review_cube, rollup, age_counts
+# Function to count reviews per value of a column, from the cube when the column is one of its dimensions
+def column_counts(data, column, cube):
+    if column == 'Age' and 'age_values' in cube:
+        return age_counts(cube)
+    if column in cube['dimensions']:
+        return rollup(cube, [column])[[column, 'Count']]
+    return data[column].value_counts().rename_axis(column).reset_index(name='Count')
+
 # Function to plot histograms
-def plot_histograms(data, column):
-    fig = px.histogram(data, x=column, title=f"Histogram of {column}", 
+def plot_histograms(data, column, cube):
+    fig = px.histogram(column_counts(data, column, cube), x=column, y='Count', histfunc='sum',
+                       title=f"Histogram of {column}", 
                        color_discrete_sequence=['mediumslateblue'], 
                        barmode='overlay',  # Change barmode to overlay
                        barnorm='percent',  # Normalize the bars to show percentage
@@ -15,13 +26,11 @@ def plot_histograms(data, column):
     return fig
 
 # Function to plot pie chart
-def plot_pie_chart(data, column):
+def plot_pie_chart(data, column, cube):
     # Get top 5 categories
-    top_5_categories = data[column].value_counts().nlargest(5).index.tolist()
-    # Filter data for top 5 categories
-    filtered_data = data[data[column].isin(top_5_categories)]
+    top_5_categories = column_counts(data, column, cube).nlargest(5, 'Count')
     # Plot pie chart
-    fig = px.pie(filtered_data, names=column, title=f"Pie Chart of {column} (Top 5)",
+    fig = px.pie(top_5_categories, names=column, values='Count', title=f"Pie Chart of {column} (Top 5)",
                  hole=0.3, color_discrete_sequence=px.colors.qualitative.Set3)
     fig.update_traces(textposition='inside', textinfo='percent+label')
     return fig
@@ -67,23 +76,28 @@ column_inferences = {
 
 
 if __name__ == "__main__":
-    # Load data from the uploaded_files folder
-    uploaded_files_folder = "uploaded_files/uploaded_files"
-    files = os.listdir(uploaded_files_folder)
-    csv_files = [file for file in files if file.endswith('.csv')]
+    # Load data from the uploaded_files folder (the first CSV file found)
+    data, data_version = load_uploaded_data()
     
-    if len(csv_files) == 0:
+    if data is None:
         st.warning("No CSV files found in the 'uploaded_files' folder.")
+        st.stop()
     else:
-        # Automatically select the first CSV file found
-        file_path = os.path.join(uploaded_files_folder, csv_files[0])
-        data = pd.read_csv(file_path)
-        
         # Drop 'Unnamed: 0' column
         if 'Unnamed: 0' in data.columns:
             data.drop(columns=['Unnamed: 0'], inplace=True)
         
+        # Optionally keep only the first copy of reposted or templated reviews
+        dedupe_reviews, dedupe_threshold = near_duplicate_settings()
+        if dedupe_reviews:
+            row_count = len(data)
+            data = drop_near_duplicates(data, data_version, dedupe_threshold)
+            st.sidebar.write(f"Removed {row_count - len(data):,} near-duplicate reviews.")
+        
     data = data.dropna().reset_index(drop=True)
+
+    # Counts per column come from a cube of the cleaned reviews, built once per dataset version
+    cube = get_review_cube((data_version, dedupe_reviews and dedupe_threshold, 'cleaned'), data)
     
     # Exclude specific columns
     excluded_columns = ['Unnamed: 0', 'Title', 'Review Text','Clothing ID','Positive Feedback Count']
@@ -107,11 +121,11 @@ if __name__ == "__main__":
     # Right column: Display histogram, pie chart, and inference
     with right_column:
         st.subheader('Histogram')
-        hist_fig = plot_histograms(data, selected_column)
+        hist_fig = plot_histograms(data, selected_column, cube)
         st.plotly_chart(hist_fig, use_container_width=True)
         
         st.subheader('Pie Chart')
-        pie_fig = plot_pie_chart(data, selected_column)
+        pie_fig = plot_pie_chart(data, selected_column, cube)
         st.plotly_chart(pie_fig, use_container_width=True)
 
     if st.button("Go to Modelling"):
@@ -1,36 +1,121 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-from sklearn.cluster import KMeans
-from sklearn.cluster import DBSCAN
-from sklearn.decomposition import PCA
-from sklearn.metrics import silhouette_score
-from sklearn.preprocessing import StandardScaler
 import plotly.express as px
 from streamlit_extras.switch_page_button import switch_page
-import os
-from sklearn.cluster import AgglomerativeClustering
-import scipy.cluster.hierarchy as sch
-import plotly.figure_factory as ff
-import matplotlib.pyplot as plt
-import plotly.graph_objects as go
+from data_loader import load_uploaded_data
+from text_features import get_text_components, combine_features
+from near_duplicates import near_duplicate_settings, drop_near_duplicates
+from shared_cache import get_artifact
+from segmentation import model_key, elbow_range, get_elbow_sweep, get_segments, fit_kmeans, nearest_cached_centroids, get_reference_segments, align_labels
+from neighbours import get_neighbour_index, similar_rows
+from kprototypes import get_mixed_segments, prototype_modes
+from stability import stability_settings, get_stability, stability_summary
+
+# scikit-learn, scipy's hierarchy module and the figure factory are imported in the branch that uses them,
+# so opening the page or switching models only loads what that model needs
+
+# The k-means commentary below is written for this many clusters; every k-means result is numbered against it
+commentary_clusters = 3
 
 # Load the dataset
 def load_data_from_uploaded_files_folder():
-    uploaded_files_folder = "uploaded_files/uploaded_files"
-    files = os.listdir(uploaded_files_folder)
-    csv_files = [file for file in files if file.endswith('.csv')]
-    
-    if len(csv_files) == 0:
+    # Automatically select the first CSV file found
+    data, version = load_uploaded_data()
+    if data is None:
         st.warning("No CSV files found in the 'uploaded_files' folder.")
-        return None
-    else:
-        # Automatically select the first CSV file found
-        file_path = os.path.join(uploaded_files_folder, csv_files[0])
-        return pd.read_csv(file_path)
+        st.stop()
+    return data, version
+
+# Function to share the fitted segments with the sentiment page
+def remember_clusters(labels):
+    st.session_state['cluster_labels'] = (data_version, labels.copy())
+
+# Function to show the mean and standard deviation of the numeric columns per cluster
+def display_cluster_statistics(data, columns=None):
+    # Select only numeric columns for aggregation
+    numeric_columns = data.select_dtypes(include=[np.number]) if columns is None else data[columns + ['Cluster']]
+
+    # Perform aggregation on numeric columns
+    cluster_stats = numeric_columns.groupby('Cluster').agg(['mean', 'std']).reset_index()
+
+    # Renaming columns for a cleaner look
+    cluster_stats.columns = ['_'.join(col).strip() for col in cluster_stats.columns.values]
+
+    # Clean up the header by removing the unnecessary '_mean' and '_std' from the index column
+    cluster_stats.rename(columns=lambda x: x.replace('_mean', '').replace('_std', '') if 'Cluster_' in x else x, inplace=True)
+
+    # Split the statistics into mean and standard deviation DataFrames for better visual display
+    cluster_mean_stats = cluster_stats[[col for col in cluster_stats.columns if '_mean' in col or 'Cluster' in col]]
+    cluster_std_stats = cluster_stats[[col for col in cluster_stats.columns if '_std' in col or 'Cluster' in col]]
+
+    # Display the mean statistics
+    st.subheader("Mean Statistics by Cluster")
+    st.dataframe(cluster_mean_stats)
+
+    # Display the standard deviation statistics
+    st.subheader("Standard Deviation Statistics by Cluster")
+    st.dataframe(cluster_std_stats)
+
+# Function to plot the pairs of features the clusters are compared on
+def plot_cluster_scatters(data):
+    # Scatter plot for Age vs. Rating
+    fig_age_rating = px.scatter(data, x='Rating', y='Age', color='Cluster', 
+                                title="Rating vs. Age (Colored by Cluster)")
+    st.plotly_chart(fig_age_rating)
+
+    # Scatter plot for Age vs. Positive Feedback Count
+    fig_age_positive_feedback = px.scatter(data, x='Age', y='Positive Feedback Count', color='Cluster', 
+                                           title="Age vs. Positive Feedback Count  (Colored by Cluster)")
+    st.plotly_chart(fig_age_positive_feedback)
+
+    # Scatter plot for Rating vs. Positive Feedback Count
+    fig_rating_positive_feedback = px.scatter(data, x='Rating', y='Positive Feedback Count', color='Cluster', 
+                                              title="Rating vs. Positive Feedback Count (Colored by Cluster)")
+    st.plotly_chart(fig_rating_positive_feedback)
+
+# Function to standardise the numeric columns, optionally adding reduced review-text features
+def build_features(data):
+    from sklearn.preprocessing import StandardScaler
+    features = data.select_dtypes(include=[np.number])
+    scaler = StandardScaler()
+    features_scaled = scaler.fit_transform(features)
+    if use_text_features:
+        # Components are computed once for the whole dataset, then the rows still in use are picked out
+        components = get_text_components(data_version, review_texts)[data.index.to_numpy()]
+        features_scaled = combine_features(features_scaled, components)
+    return features_scaled
+
+# Function to key cached modelling artifacts by everything that changes the feature matrix
+def artifact_key(name, *params):
+    return model_key(name, data_version, dedupe_reviews and dedupe_threshold, use_text_features, *params)
+
+# Function to show how often each cluster comes back when the model is refitted on resampled data
+def show_stability(features_scaled, labels, algorithm, n_clusters):
+    # The reported labels are part of the key, so each row of the table describes the cluster shown with its id
+    labelling = int(pd.util.hash_pandas_object(pd.Series(labels)).sum())
+    stability = get_stability(artifact_key('stability', algorithm, n_clusters, labelling, stability_runs, stability_early_stop),
+                              features_scaled, labels, algorithm, n_clusters, stability_runs, stability_early_stop)
+    st.subheader("Cluster Stability")
+    note = "estimates converged" if stability['converged'] else "estimates had not converged yet"
+    st.write(f"{stability['runs']} bootstrap runs of {stability['resample_rows']:,} rows ({note}).")
+    st.dataframe(stability_summary(stability, labels))
+    fig_ari = px.histogram(x=stability['ari'], nbins=20, title="Adjusted Rand Index against the Reported Clusters")
+    fig_ari.update_layout(xaxis_title="Adjusted Rand Index", yaxis_title="Runs")
+    st.plotly_chart(fig_ari)
+    st.write(f"Median adjusted Rand index: {np.median(stability['ari']):.3f}. "
+             "Clusters with a mean Jaccard below 0.6 often dissolve on slightly different data; "
+             "read the commentary about them with care.")
 
 # Load the dataset
-data = load_data_from_uploaded_files_folder()
+data, data_version = load_data_from_uploaded_files_folder()
+raw_data = data.copy()
+review_texts = data['Review Text']
+
+# Optionally leave reposted or templated reviews out of the segmentation
+dedupe_reviews, dedupe_threshold = near_duplicate_settings()
+if dedupe_reviews:
+    data = drop_near_duplicates(data, data_version, dedupe_threshold)
 
 # Title for model selection
 st.title("Model Selection")
@@ -38,7 +123,13 @@ st.title("Model Selection")
 # Dropdown menu for model selection
 model_type = st.selectbox(
     "Choose a clustering model:",
-    ("k-means", "hierarchical clustering", "DBSCAN")
+    ("k-means", "hierarchical clustering", "k-prototypes (mixed types)", "DBSCAN")
+)
+
+# Segment on what customers wrote as well as on the numeric columns
+use_text_features = st.checkbox(
+    "Include review text features",
+    help="Adds hashed TF-IDF features of the review text, reduced with truncated SVD, to the scaled numeric columns.",
 )
 
 if model_type == "k-means":
@@ -47,14 +138,12 @@ if model_type == "k-means":
     
     # Elbow Method for Optimal k
     st.subheader("Elbow Method for Optimal k")
-    sse = []
-    for k in range(1, 11):
-        kmeans = KMeans(n_clusters=k, random_state=0)
-        kmeans.fit(data.select_dtypes(include=[np.number]))
-        sse.append(kmeans.inertia_)
+    # The sweep is shared by every session looking at the same data and settings
+    sse = get_elbow_sweep(artifact_key('elbow'), lambda: (
+        build_features(data) if use_text_features else data.select_dtypes(include=[np.number])))
     
     # Plotting the Elbow Method graph
-    fig_elbow = px.line(x=range(1, 11), y=sse, markers=True, title="Elbow Method Graph")
+    fig_elbow = px.line(x=elbow_range, y=sse, markers=True, title="Elbow Method Graph")
     fig_elbow.update_layout(xaxis_title="Number of Clusters", yaxis_title="Sum of Squared Distances", xaxis_dtick=1)
     st.plotly_chart(fig_elbow)
     
@@ -63,49 +152,63 @@ if model_type == "k-means":
     
     # Allow the user to select the number of clusters after viewing the elbow plot
     num_clusters = st.slider("Select the number of clusters (k):", min_value=2, max_value=10, value=3, step=1)
+    stability_runs, stability_early_stop = stability_settings()
     
     # Perform K-Means Clustering and display results
     if st.button("Perform Clustering"):
+        from sklearn.metrics import silhouette_score
+
         # Standardizing the features
-        features = data.select_dtypes(include=[np.number])
-        scaler = StandardScaler()
-        features_scaled = scaler.fit_transform(features)
+        features_scaled = build_features(data)
         
+        # Fits start from the centroids this session found for the nearest k instead of a cold k-means++ start
+        warm_start = st.session_state.setdefault('kmeans_warm_start', {}).setdefault(artifact_key('kmeans'), {})
+        start_centroids = nearest_cached_centroids(warm_start, num_clusters)
+        # The commentary's k is always fitted cold, so it gets the reference segments whatever was tried before
+        if num_clusters == commentary_clusters:
+            start_centroids = None
+
         # Apply KMeans and predict clusters
-        kmeans = KMeans(n_clusters=num_clusters, random_state=0)
-        data['Cluster'] = kmeans.fit_predict(features_scaled)
+        if use_text_features or dedupe_reviews:
+            kmeans = get_artifact(artifact_key('kmeans', num_clusters),
+                                  fit_kmeans, features_scaled, num_clusters, start_centroids)
+            labels = kmeans.labels_
+        else:
+            # Reviews appended since the last fit are assigned to the saved segments until they drift
+            segments = get_segments(artifact_key('segments', num_clusters),
+                                    data.select_dtypes(include=[np.number]), num_clusters, start_centroids)
+            kmeans, labels = segments['model'], segments['labels']
+            if segments['drift'] is not None:
+                drift = segments['drift']
+                action = "Segments were refitted" if segments['refit'] else \
+                    f"{segments['assigned_rows']:,} appended reviews were assigned to the saved segments"
+                st.info(f"{action} (cluster share PSI {drift['label_psi']:.3f}, "
+                        f"distance ratio {drift['distance_ratio']:.2f}).")
+
+        warm_start[num_clusters] = kmeans.cluster_centers_
+
+        # Number the clusters against the reference segments (a cold fit with the commentary's k), so the k=3
+        # commentary below describes the clusters it names; the clusters beyond those keep the ids they had in
+        # this session's previous result, so a segment keeps its id (and colour) as k is raised or lowered
+        reference = get_reference_segments(artifact_key('kmeans_reference'), data, features_scaled, commentary_clusters)
+        previous_labels = st.session_state.setdefault('kmeans_previous_labels', {})
+        mapping = align_labels(labels, reference, num_clusters, previous_labels.get(artifact_key('kmeans')))
+        data['Cluster'] = mapping[labels]
+        previous_labels[artifact_key('kmeans')] = data['Cluster'].to_numpy()
+        st.caption(f"k-means converged in {kmeans.n_iter_} iterations.")
+        remember_clusters(data['Cluster'])
         
         # Calculate silhouette score
         silhouette_avg = silhouette_score(features_scaled, data['Cluster'])
         st.write(f"Silhouette Score for {num_clusters} clusters:", silhouette_avg)
         st.write("Silhouette Score is moderate (~0.23), suggesting that while there is some cluster cohesion.")
+        if stability_runs:
+            show_stability(features_scaled, data['Cluster'].to_numpy(), 'k-means', num_clusters)
         
-        # Select only numeric columns for aggregation
-        numeric_columns = data.select_dtypes(include=[np.number])
-
-        # Perform aggregation on numeric columns
-        cluster_stats = numeric_columns.groupby('Cluster').agg(['mean', 'std']).reset_index()
-        
-        # Renaming columns for a cleaner look
-        cluster_stats.columns = ['_'.join(col).strip() for col in cluster_stats.columns.values]
-        
-        # Clean up the header by removing the unnecessary '_mean' and '_std' from the index column
-        cluster_stats.rename(columns=lambda x: x.replace('_mean', '').replace('_std', '') if 'Cluster_' in x else x, inplace=True)
-        
-        # Split the statistics into mean and standard deviation DataFrames for better visual display
-        cluster_mean_stats = cluster_stats[[col for col in cluster_stats.columns if '_mean' in col or 'Cluster' in col]]
-        cluster_std_stats = cluster_stats[[col for col in cluster_stats.columns if '_std' in col or 'Cluster' in col]]
-        
-        # Display the mean statistics
-        st.subheader("Mean Statistics by Cluster")
-        st.dataframe(cluster_mean_stats)
-        
-        # Display the standard deviation statistics
-        st.subheader("Standard Deviation Statistics by Cluster")
-        st.dataframe(cluster_std_stats)
+        display_cluster_statistics(data)
         
         # Description after cluster statistics tables
-        if num_clusters == 3:  # Display inferences only when k=3
+        if num_clusters == commentary_clusters:  # Display inferences only when k=3
             st.write("""
             - **Cluster 0:** Low ratings, not recommended often, diverse feedback.
             - **Cluster 1:** High ratings, highly recommended, consistent feedback.
@@ -158,37 +261,32 @@ if model_type == "k-means":
             # Scatter plot visualizations for specified pairs of features
             st.subheader("Scatter Plots by Cluster")
             
-            # Scatter plot for Age vs. Rating
-            fig_age_rating = px.scatter(data, x='Rating', y='Age', color='Cluster', 
-                                        title="Rating vs. Age (Colored by Cluster)")
-            st.plotly_chart(fig_age_rating)
-            
-            # Scatter plot for Age vs. Positive Feedback Count
-            fig_age_positive_feedback = px.scatter(data, x='Age', y='Positive Feedback Count', color='Cluster', 
-                                                   title="Age vs. Positive Feedback Count  (Colored by Cluster)")
-            st.plotly_chart(fig_age_positive_feedback)
-    
-            # Scatter plot for Rating vs. Positive Feedback Count
-            fig_rating_positive_feedback = px.scatter(data, x='Rating', y='Positive Feedback Count', color='Cluster', 
-                                                      title="Rating vs. Positive Feedback Count (Colored by Cluster)")
-            st.plotly_chart(fig_rating_positive_feedback)
+            plot_cluster_scatters(data)
 
 
 
 
 elif model_type == "hierarchical clustering":
     st.write("Hierarchical clustering model selected.")
+    stability_runs, stability_early_stop = stability_settings()
 
     # Perform Hierarchical Clustering and display results
     if st.button("Perform Clustering"):
+        from sklearn.cluster import AgglomerativeClustering
+        from sklearn.decomposition import PCA
+        import scipy.cluster.hierarchy as sch
+        import plotly.figure_factory as ff
+
         # Standardizing the features
-        features = data.select_dtypes(include=[np.number])
-        scaler = StandardScaler()
-        features_scaled = scaler.fit_transform(features)
+        features_scaled = build_features(data)
         
         # Perform hierarchical clustering
-        hc = AgglomerativeClustering(n_clusters=3, linkage='ward')
-        data['Cluster'] = hc.fit_predict(features_scaled)
+        hc = get_artifact(artifact_key('hierarchical', 3),
+                          AgglomerativeClustering(n_clusters=3, linkage='ward').fit, features_scaled)
+        data['Cluster'] = hc.labels_
+        remember_clusters(data['Cluster'])
+        if stability_runs:
+            show_stability(features_scaled, hc.labels_, 'hierarchical', 3)
         
         # Calculate linkage matrix
         linkage_matrix = sch.linkage(features_scaled.T, method='ward')  # Transpose the DataFrame for correct orientation
@@ -326,6 +424,34 @@ elif model_type == "hierarchical clustering":
 
                 """)
 
+elif model_type == "k-prototypes (mixed types)":
+    # K-Prototypes Clustering on numeric and categorical columns together
+    st.header("K-Prototypes Clustering")
+    st.write("Segments on the numeric columns and on Division, Department and Class Name together: numeric columns "
+             "are compared by distance and categories by mismatches. Identifier columns are left out.")
+
+    num_clusters = st.slider("Select the number of clusters (k):", min_value=2, max_value=10, value=3, step=1)
+    gamma = st.slider("Weight of a category mismatch (0 = automatic):", min_value=0.0, max_value=3.0, value=0.0, step=0.1)
+
+    # Perform K-Prototypes Clustering and display results
+    if st.button("Perform Clustering"):
+        text_components = get_text_components(data_version, review_texts)[data.index.to_numpy()] if use_text_features else None
+        segments = get_mixed_segments(artifact_key('kprototypes', num_clusters, gamma), data, num_clusters,
+                                      gamma or None, text_components)
+        data['Cluster'] = segments['labels']
+        remember_clusters(data['Cluster'])
+        st.write(f"Clustering cost: {segments['cost']:,.1f} (category mismatch weight {segments['gamma']:.2f}, "
+                 f"{segments['iterations']} iterations)")
+
+        # Most common category of every categorical column in each cluster
+        st.subheader("Most Common Categories by Cluster")
+        st.dataframe(prototype_modes(segments))
+
+        display_cluster_statistics(data, segments['numeric_columns'])
+
+        st.subheader("Scatter Plots by Cluster")
+        plot_cluster_scatters(data)
+
 elif model_type == "DBSCAN":
     # DBSCAN Clustering Visualization and Parameter Selection
     st.header("DBSCAN Clustering")
@@ -336,14 +462,16 @@ elif model_type == "DBSCAN":
 
     # Perform DBSCAN Clustering and display results
     if st.button("Perform Clustering"):
+        from sklearn.cluster import DBSCAN
+
         # Standardizing the features
-        features = data.select_dtypes(include=[np.number])
-        scaler = StandardScaler()
-        features_scaled = scaler.fit_transform(features)
+        features_scaled = build_features(data)
 
         # Apply DBSCAN and predict clusters
-        dbscan = DBSCAN(eps=eps, min_samples=min_samples)
-        data['Cluster'] = dbscan.fit_predict(features_scaled)
+        dbscan = get_artifact(artifact_key('dbscan', eps, min_samples),
+                              DBSCAN(eps=eps, min_samples=min_samples).fit, features_scaled)
+        data['Cluster'] = dbscan.labels_
+        remember_clusters(data['Cluster'])
 
         # Number of clusters in labels, ignoring noise if present.
         n_clusters_ = len(set(data['Cluster'])) - (1 if -1 in data['Cluster'] else 0)
@@ -409,6 +537,33 @@ elif model_type == "DBSCAN":
                 A higher density of data points could potentially lead to some clustering at lower ages and feedback counts, as these points are closer together.
                 we begin to see larger clusters forming at lower feedback counts and younger ages, it may indicate that younger individuals are more active in giving feedback, or that the majority of feedback comes from this demographic.  """)
 
+# Explore the segments: pick a customer in the scatter plot and list the most similar customers
+st.header("Similar Customers")
+# The neighbour index (and the text features it can match on) is only built once the section is opened
+if st.checkbox("Find similar customers", key="show_neighbours"):
+    match_text = st.checkbox("Match on review text as well", key="neighbour_text")
+    neighbour_index = get_neighbour_index(data_version, 'customers+text' if match_text else 'customers', raw_data)
+
+    explore = raw_data.loc[data.index]
+    cluster_labels = st.session_state.get('cluster_labels')
+    if cluster_labels is not None and cluster_labels[0] == data_version:
+        explore = explore.assign(Cluster=cluster_labels[1].reindex(data.index))
+    fig_explore = px.scatter(explore.reset_index(names='Row'), x='Age', y='Positive Feedback Count', custom_data=['Row'],
+                             color='Cluster' if 'Cluster' in explore.columns else None,
+                             title="Click a customer to see the most similar ones")
+    selection = st.plotly_chart(fig_explore, on_select="rerun", selection_mode="points", key="neighbour_scatter")
+
+    points = selection.selection.points if selection else []
+    clicked_row = int(points[0]['customdata'][0]) if points else int(explore.index[0])
+    selected_row = st.number_input("Or enter a row number:", min_value=0, max_value=int(raw_data.index.max()),
+                                   value=clicked_row, step=1)
+    num_neighbours = st.slider("Number of similar customers:", min_value=5, max_value=50, value=10, step=5)
+
+    st.write("Selected customer:")
+    st.dataframe(raw_data.loc[[selected_row]])
+    st.write("Most similar customers:")
+    st.dataframe(similar_rows(neighbour_index, explore, selected_row, num_neighbours))
+
 if st.button("Click for Sentiment Analysis"):
     switch_page("page5_SentimentAnalysis")
 
@@ -1,11 +1,15 @@
-import os
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
-from textblob import TextBlob
 import streamlit as st
-import streamlit as st
-from streamlit_custom_notification_box import custom_notification_box
+from sentiment_scoring import sentiment_engines, get_polarity
+from sentiment_charts import plot_age_feedback_summary, plot_age_feedback_reviews, age_feedback_diagnostics
+from data_loader import load_uploaded_data
+from review_index import get_review_index, search_reviews
+from phrase_mining import get_phrase_counts, get_distinctive_phrases
+from near_duplicates import near_duplicate_settings, drop_near_duplicates
+from neighbours import get_neighbour_index, similar_rows
+from review_cube import get_review_cube, rollup, polarity_histogram, polarity_signs, polarity_quartiles, filter_rows
 
 # Set page config
 st.set_page_config(page_title="Sentiment Analysis", layout="wide")
@@ -13,35 +17,65 @@ st.set_page_config(page_title="Sentiment Analysis", layout="wide")
 # Page header
 st.title("Sentiment Analysis on Customer Reviews")
 
-# Load data from the uploaded_files folder
-uploaded_files_folder = "uploaded_files/uploaded_files"
-files = os.listdir(uploaded_files_folder)
-csv_files = [file for file in files if file.endswith('.csv')]
+# Load data from the uploaded_files folder (the first CSV file found)
+data, data_version = load_uploaded_data()
 
-if len(csv_files) == 0:
+if data is None:
     st.warning("No CSV files found in the 'uploaded_files' folder.")
 else:
-    # Automatically select the first CSV file found
-    file_path = os.path.join(uploaded_files_folder, csv_files[0])
-    data = pd.read_csv(file_path)
-    
+    # Keyword index over the review text and titles, built once per dataset version
+    review_index = get_review_index(data_version, data)
+    phrase_counts = get_phrase_counts(data_version, data['Review Text'])
+    review_texts = data['Review Text']
+
+    # Optionally score only the first copy of reposted or templated reviews
+    dedupe_reviews, dedupe_threshold = near_duplicate_settings()
+    if dedupe_reviews:
+        data = drop_near_duplicates(data, data_version, dedupe_threshold)
+
     # Drop 'Unnamed: 0' column
     if 'Unnamed: 0' in data.columns:
         data.drop(columns=['Unnamed: 0'], inplace=True)
     
-    # Convert the Review Text column to string and calculate sentiment polarity
+    # Choose how polarity is computed; both engines give the same scores
+    sentiment_engine = st.sidebar.radio(
+        "Sentiment engine:",
+        sentiment_engines,
+        help="The vectorized engine scores the whole column at once with TextBlob's lexicon and is much faster on large datasets.",
+    )
+
+    # Convert the Review Text column to string and calculate sentiment polarity,
+    # once per dataset version and engine for every session
     data['Review Text'] = data['Review Text'].astype(str)
-    data['polarity'] = data['Review Text'].apply(lambda x: TextBlob(x).sentiment.polarity)
+    polarity = get_polarity(data_version, review_texts, sentiment_engine)
+    data['polarity'] = polarity.reindex(data.index)
     
-    # Drop rows with missing values and reset index
-    data = data.dropna().reset_index(drop=True)
+    # Drop rows with missing values, keeping the original row numbers so search hits can be matched back
+    data = data.dropna()
+
+    # Attach the segments from the modelling page when they were fitted on this dataset
+    cluster_labels = st.session_state.get('cluster_labels')
+    if cluster_labels is not None and cluster_labels[0] == data_version:
+        data['Cluster'] = cluster_labels[1].reindex(data.index)
+
+    # Charts are drawn from a cube of per-cell totals, built once per dataset, settings and segmentation
+    segmentation = int(pd.util.hash_pandas_object(data['Cluster']).sum()) if 'Cluster' in data.columns else None
+    cube = get_review_cube((data_version, dedupe_reviews and dedupe_threshold, sentiment_engine, segmentation), data)
+
+    # Filters narrow every chart in the two columns below: the cube charts roll up only the matching cells,
+    # the Age vs Positive Feedback chart (drawn from individual reviews) uses the matching rows
+    chart_filters = {}
+    with st.sidebar.expander("Chart filters"):
+        for dimension in cube['dimensions']:
+            chart_filters[dimension] = st.multiselect(f"{dimension}:", list(cube['categories'][dimension]),
+                                                      key=f"chart_filter_{dimension}")
 
     # Arrange the Plotly visualizations in two columns
     col1, col2 = st.columns(2)
 
     with col1:
         # Visualization 1: Count of Ratings
-        fig_ratings = px.histogram(data, x='Rating', title='Count of Ratings')
+        fig_ratings = px.bar(rollup(cube, ['Rating'], chart_filters), x='Rating', y='Count', title='Count of Ratings')
         fig_ratings.update_layout(width=400, height=350)  # Adjust size here
         st.plotly_chart(fig_ratings)
         st.write("""
@@ -54,11 +88,20 @@ else:
 
 
         # Visualization 3: Age vs Positive Feedback
-        fig_age_feedback = px.scatter(data, x='Age', y='Positive Feedback Count', 
-                                      title='Age vs Positive Feedback Count', trendline='ols', 
-                                      color='Age', size='Positive Feedback Count', hover_data=['Class Name'])
-        fig_age_feedback.update_layout(width=400, height=350)  # Adjust size here
-        st.plotly_chart(fig_age_feedback)
+        # The trend line is fitted once per dataset with NumPy; per-age summaries keep the chart small
+        age_feedback_view = st.radio("Age vs Positive Feedback view:", ("Per-age summary", "Individual reviews"), horizontal=True)
+        filtered_data = filter_rows(data, chart_filters)
+        if filtered_data.empty:
+            st.info("No reviews match the chart filters.")
+        else:
+            if age_feedback_view == "Per-age summary":
+                fig_age_feedback = plot_age_feedback_summary(filtered_data)
+            else:
+                fig_age_feedback = plot_age_feedback_reviews(filtered_data)
+            fig_age_feedback.update_layout(width=400, height=350)  # Adjust size here
+            st.plotly_chart(fig_age_feedback)
+            if st.checkbox("Show full regression diagnostics"):
+                st.text(age_feedback_diagnostics(filtered_data).as_text())
         st.write("""
         - There's a wide distribution of ages providing positive feedback, but there appears to be a concentration of feedback from customers in the 30-50 age range. 
         - This could suggest that this demographic is more engaged in providing feedback or they may represent a larger segment of the customer base.
@@ -68,8 +111,15 @@ else:
         st.write("""Craft campaigns that resonate with the 30-50 sweet spot & Pitch quality and style to our most engaged age bracket""")
 
         # Visualization 5: Boxplot of Polarity by Department Name
-        fig_polarity_department = px.box(data, x='Department Name', y='polarity', 
-                                         title='Polarity by Department Name', color='Department Name')
+        # The boxes are drawn from quartiles estimated on the cube's polarity histograms
+        department_quartiles = polarity_quartiles(cube, 'Department Name', chart_filters)
+        fig_polarity_department = go.Figure([
+            go.Box(name=str(row['Department Name']), x=[str(row['Department Name'])], q1=[row['q1']], median=[row['median']],
+                   q3=[row['q3']], lowerfence=[row['min']], upperfence=[row['max']])
+            for _, row in department_quartiles.iterrows()
+        ])
+        fig_polarity_department.update_layout(title_text='Polarity by Department Name', xaxis_title='Department Name',
+                                              yaxis_title='polarity', legend_title_text='Department Name')
         fig_polarity_department.update_layout(width=400, height=350)  # Adjust size here
         st.plotly_chart(fig_polarity_department)
         st.write("""
@@ -81,7 +131,8 @@ else:
 
     with col2:
         # Visualization 2: Count of Reviews by Class Name
-        fig_class_name = px.histogram(data, x='Class Name', title='Count of Reviews by Class Name', color='Class Name')
+        fig_class_name = px.bar(rollup(cube, ['Class Name'], chart_filters), x='Class Name', y='Count',
+                                title='Count of Reviews by Class Name', color='Class Name')
         fig_class_name.update_layout(width=400, height=350)  # Adjust size here
         st.plotly_chart(fig_class_name)
         st.write("""
@@ -93,8 +144,9 @@ else:
         st.write("""Ramp up marketing for Dresses & Knits – our crowd pleasers! Delve into low-review categories for a revamp.""")
 
         # Visualization 4: Distribution of Polarity
-        fig_polarity_dist = px.histogram(data, x='polarity', title='Distribution of Polarity', nbins=40)
-        fig_polarity_dist.update_layout(width=400, height=350)  # Adjust size here
+        fig_polarity_dist = px.bar(polarity_histogram(cube, 40, chart_filters), x='polarity', y='Count',
+                                   title='Distribution of Polarity')
+        fig_polarity_dist.update_layout(width=400, height=350, bargap=0)  # Adjust size here
         st.plotly_chart(fig_polarity_dist)
         st.write("""
         - The distribution is centered around a positive polarity, indicating that reviews are generally positive. 
@@ -105,7 +157,7 @@ else:
         st.write("""Launch a 'Review & Reward' program to inspire detailed feedback & Incentivize comprehensive reviews for rare insights.""")
 
         # Visualization 6: Pie Chart for Polarity Distribution
-        polarity_counts = data['polarity'].apply(lambda x: 'Positive' if x > 0 else ('Neutral' if x == 0 else 'Negative')).value_counts()
+        polarity_counts = polarity_signs(cube, chart_filters).sort_values(ascending=False)
         fig_polarity_pie = go.Figure(data=[go.Pie(labels=polarity_counts.index, values=polarity_counts, hole=.3)])
         fig_polarity_pie.update_layout(title_text='Polarity Distribution', width=400, height=350)  # Adjust size here
         st.plotly_chart(fig_polarity_pie)
@@ -116,3 +168,55 @@ else:
             """)
         st.write("""WHAT ACTION CAN BE TAKEN?""")
         st.write("""Capitalize on positivity in our promotions to lure in new customers & Transform negative feedback into improvement blueprints.""")
+
+    # Phrases that set each department, class, segment or sentiment bucket apart
+    st.header("Distinctive Phrases")
+    breakdowns = data[['Department Name', 'Class Name']].copy()
+    breakdowns['Polarity Bucket'] = pd.cut(data['polarity'], [-1.01, -1e-12, 1e-12, 1.01], labels=['Negative', 'Neutral', 'Positive']).astype(str)
+    if 'Cluster' in data.columns:
+        breakdowns['Cluster'] = data['Cluster']
+    # Same settings as the cube: the rows, their polarity buckets and their clusters
+    phrase_rankings = get_distinctive_phrases((data_version, dedupe_reviews and dedupe_threshold, sentiment_engine, segmentation),
+                                              breakdowns, phrase_counts)
+
+    phrase_col1, phrase_col2 = st.columns(2)
+    with phrase_col1:
+        breakdown = st.selectbox("Break reviews down by:", list(phrase_rankings))
+    with phrase_col2:
+        group = st.selectbox("Group:", sorted(phrase_rankings[breakdown], key=str))
+    st.dataframe(phrase_rankings[breakdown][group], use_container_width=True)
+    st.write("""Phrases are ranked by a log-odds score against all other reviews, so they show what is said more often in this group than elsewhere.""")
+
+    # Keyword drill-down into individual reviews
+    st.header("Search Reviews")
+    query = st.text_input('Search review text and titles (e.g. fit AND fabric, "runs small", dress -return, zipper OR button):')
+    filter_col1, filter_col2, filter_col3 = st.columns(3)
+    with filter_col1:
+        departments = st.multiselect("Department:", sorted(data['Department Name'].unique()))
+    with filter_col2:
+        classes = st.multiselect("Class:", sorted(data['Class Name'].unique()))
+    with filter_col3:
+        polarity_range = st.slider("Polarity range:", min_value=-1.0, max_value=1.0, value=(-1.0, 1.0), step=0.05)
+    clusters = None
+    if 'Cluster' in data.columns:
+        clusters = st.multiselect("Cluster:", sorted(data['Cluster'].unique()))
+
+    if query:
+        page_size = 20
+        page = st.number_input("Results page:", min_value=1, value=1, step=1)
+        total, results = search_reviews(review_index, data, query, departments, classes, polarity_range,
+                                        clusters, page=page, page_size=page_size)
+        st.write(f"{total} matching reviews")
+        result_columns = [col for col in ['Title', 'Review Text', 'Rating', 'Department Name', 'Class Name', 'polarity', 'Cluster']
+                          if col in results.columns]
+        selected = st.dataframe(results[result_columns], use_container_width=True,
+                                on_select="rerun", selection_mode="single-row", key="search_results")
+
+        # Pick a review in the results to list the reviews closest to it in meaning
+        if selected and selected.selection.rows:
+            selected_row = results.index[selected.selection.rows[0]]
+            neighbour_index = get_neighbour_index(data_version, 'reviews', review_texts.to_frame())
+            similar = similar_rows(neighbour_index, data, selected_row, k=10)
+            st.subheader("Similar Reviews")
+            st.write(f"Reviews closest to: *{str(data.loc[selected_row, 'Review Text'])[:200]}*")
+            st.dataframe(similar[['Distance'] + result_columns], use_container_width=True)
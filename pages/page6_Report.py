@@ -0,0 +1,61 @@
+import os
+
+import streamlit as st
+from data_loader import active_dataset_path, dataset_version, load_uploaded_data
+from report_snapshot import list_snapshots, snapshot_path, load_snapshot, publish_snapshot
+
+# Viewers are served from the published snapshot: nothing is loaded, scored or fitted on this page
+# unless someone publishes a new one
+
+
+# Function to show the items of a report section, recursing into the ones the viewer picks from
+def render_items(items, key):
+    for position, item in enumerate(items):
+        if item['kind'] == 'text':
+            st.write(item['text'])
+        elif item['kind'] == 'figure':
+            st.plotly_chart(item['figure'], use_container_width=True)
+        elif item['kind'] == 'table':
+            if item['title']:
+                st.subheader(item['title'])
+            st.dataframe(item['table'], use_container_width=True, hide_index=True)
+        elif item['kind'] == 'choice':
+            choice_key = f"{key}-{position}"
+            option = st.selectbox(item['label'], list(item['options']), key=choice_key)
+            render_items(item['options'][option], choice_key)
+
+
+st.set_page_config(page_title="Report", layout="wide")
+st.title("Published Report")
+
+# Default to the snapshot of the dataset this session works on, then to the newest one
+dataset_path = active_dataset_path()
+current_version = dataset_version(dataset_path) if dataset_path is not None else None
+snapshots = list_snapshots()
+current_snapshot = snapshot_path(current_version) if current_version is not None else None
+
+with st.sidebar:
+    if current_version is not None:
+        # One analyst publishes; every viewer after that reads the stored snapshot
+        if st.button("Publish report for the current dataset"):
+            with st.spinner("Rendering every page of the report..."):
+                data, version = load_uploaded_data()
+                current_snapshot = publish_snapshot(data, version)
+            snapshots = list_snapshots()
+            st.success("Report published.")
+
+if not snapshots:
+    st.info("No report has been published yet. Use the button in the sidebar to publish one for the current dataset.")
+else:
+    names = [os.path.basename(path).split('.')[0] for path in snapshots]
+    default = snapshots.index(current_snapshot) if current_snapshot in snapshots else 0
+    selected = st.selectbox("Dataset version:", names, index=default)
+    snapshot = load_snapshot(snapshots[names.index(selected)])
+    if selected != current_version:
+        st.warning("This report was published for a different dataset than the one you are working on.")
+    st.caption(f"Published {snapshot['published']} from {snapshot['rows']:,} rows "
+               f"({snapshot['settings']['clusters']} clusters, {snapshot['settings']['sentiment_engine']}).")
+
+    for number, section in enumerate(snapshot['sections']):
+        st.header(section['title'])
+        render_items(section['items'], f"section-{number}")
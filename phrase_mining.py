@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+import streamlit as st
+
+from shared_cache import get_artifact
+
+# Phrases must appear in at least this many reviews, and at most this many are kept
+min_reviews = 5
+max_phrases = 50000
+
+
+# Function to count unigrams and bigrams in every review as one sparse matrix
+def count_phrases(texts):
+    from sklearn.feature_extraction.text import CountVectorizer
+    vectorizer = CountVectorizer(ngram_range=(1, 2), stop_words='english', min_df=min_reviews,
+                                 max_features=max_phrases, dtype=np.float32)
+    counts = vectorizer.fit_transform(texts.fillna('').astype(str))
+    return counts.tocsr(), vectorizer.get_feature_names_out()
+
+
+# Function to rank the phrases that set each group apart from the rest of the reviews
+def distinctive_phrases(counts, vocabulary, labels, top_n=15):
+    # labels is indexed by row number of the counts matrix; missing labels are left out
+    codes, groups = pd.factorize(labels)
+    keep = codes >= 0
+    membership = sp.csr_matrix(
+        (np.ones(keep.sum(), dtype=np.float32), (codes[keep], labels.index.to_numpy()[keep])),
+        shape=(len(groups), counts.shape[0]),
+    )
+    group_counts = np.asarray((membership @ counts).todense(), dtype=float)
+
+    # Log-odds ratio with an informative Dirichlet prior (the counts over all reviews)
+    prior = group_counts.sum(axis=0)
+    prior_total = prior.sum()
+    in_group = group_counts
+    out_group = prior - in_group
+    in_total = in_group.sum(axis=1, keepdims=True)
+    out_total = out_group.sum(axis=1, keepdims=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        delta = (np.log((in_group + prior) / (in_total + prior_total - in_group - prior))
+                 - np.log((out_group + prior) / (out_total + prior_total - out_group - prior)))
+        z_scores = delta / np.sqrt(1.0 / (in_group + prior) + 1.0 / (out_group + prior))
+    z_scores = np.where(in_group > 0, np.nan_to_num(z_scores, nan=-np.inf), -np.inf)
+
+    rankings = {}
+    for i, group in enumerate(groups):
+        top = np.argsort(-z_scores[i])[:top_n]
+        top = top[np.isfinite(z_scores[i, top])]
+        rankings[group] = pd.DataFrame({
+            'Phrase': vocabulary[top],
+            'Score': z_scores[i, top].round(2),
+            'Occurrences': in_group[i, top].astype(int),
+        })
+    return rankings
+
+
+# Function to count phrases once per dataset version, shared by every session
+def get_phrase_counts(version, texts):
+    with st.spinner("Counting phrases..."):
+        return get_artifact(('phrase_counts', version), count_phrases, texts)
+
+
+# Function to rank phrases for every breakdown column in one pass, so switching breakdowns is a lookup
+def rank_breakdowns(phrase_counts, breakdowns, top_n=15):
+    counts, vocabulary = phrase_counts
+    return {column: distinctive_phrases(counts, vocabulary, breakdowns[column], top_n) for column in breakdowns.columns}
+
+
+# Function to get the phrase rankings once per dataset and settings, shared by every session
+def get_distinctive_phrases(key, breakdowns, phrase_counts, top_n=15):
+    with st.spinner("Ranking distinctive phrases..."):
+        return get_artifact(('phrases',) + key + (top_n,), rank_breakdowns, phrase_counts, breakdowns, top_n)
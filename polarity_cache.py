@@ -0,0 +1,100 @@
+import hashlib
+import os
+import sqlite3
+from contextlib import closing
+
+import pandas as pd
+
+# Define the path to the on-disk sentiment store, kept next to the uploaded files
+cache_path = os.path.join('uploaded_files', 'polarity_cache.sqlite')
+
+
+# Function to build a stable key for a review from its text
+def review_key(text):
+    return hashlib.sha1(str(text).encode('utf-8')).hexdigest()
+
+
+# Function to open the store, creating the folder and table on first use
+def connect(path=cache_path):
+    folder = os.path.dirname(path)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS sentiment (
+            key TEXT PRIMARY KEY,
+            polarity REAL NOT NULL,
+            subjectivity REAL NOT NULL
+        )
+    """)
+    return conn
+
+
+# Function to fetch cached (polarity, subjectivity) pairs for many keys in one query
+def lookup_sentiment(keys, path=cache_path):
+    if len(keys) == 0:
+        return {}
+    with closing(connect(path)) as conn:
+        # Join against a temporary key table instead of issuing one query per review
+        conn.execute("CREATE TEMP TABLE wanted (key TEXT PRIMARY KEY)")
+        conn.executemany("INSERT OR IGNORE INTO wanted VALUES (?)", ((key,) for key in keys))
+        rows = conn.execute("""
+            SELECT sentiment.key, sentiment.polarity, sentiment.subjectivity
+            FROM sentiment JOIN wanted ON sentiment.key = wanted.key
+        """)
+        return {key: (polarity, subjectivity) for key, polarity, subjectivity in rows}
+
+
+# Function to write newly scored reviews to the store in a single transaction
+def store_sentiment(scores, path=cache_path):
+    if len(scores) == 0:
+        return
+    with closing(connect(path)) as conn:
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO sentiment (key, polarity, subjectivity) VALUES (?, ?, ?)",
+                ((key, float(polarity), float(subjectivity)) for key, (polarity, subjectivity) in scores.items()),
+            )
+
+
+# Function to score reviews one by one with TextBlob
+def score_textblob(texts):
+    from textblob import TextBlob
+
+    sentiments = [TextBlob(text).sentiment for text in texts]
+    return pd.DataFrame(
+        {
+            'polarity': [sentiment.polarity for sentiment in sentiments],
+            'subjectivity': [sentiment.subjectivity for sentiment in sentiments],
+        },
+        index=texts.index,
+    )
+
+
+# Function to return sentiment for a column of reviews, scoring only texts not seen before
+def cached_sentiment(reviews, scorer=score_textblob, path=cache_path):
+    texts = reviews.astype(str)
+
+    # Every distinct text is looked up (and, if needed, scored) only once
+    unique_texts = pd.Series(texts.unique())
+    keys = unique_texts.map(review_key)
+    found = lookup_sentiment(keys.tolist(), path)
+
+    missing = ~keys.isin(list(found))
+    if missing.any():
+        scored = scorer(unique_texts[missing])
+        new_scores = {
+            key: (polarity, subjectivity)
+            for key, polarity, subjectivity in zip(keys[missing], scored['polarity'], scored['subjectivity'])
+        }
+        store_sentiment(new_scores, path)
+        found.update(new_scores)
+
+    by_text = pd.DataFrame(
+        [found[key] for key in keys],
+        columns=['polarity', 'subjectivity'],
+        index=unique_texts.values,
+    )
+    result = by_text.reindex(texts.values)
+    result.index = reviews.index
+    return result
@@ -0,0 +1,245 @@
+import json
+import os
+import time
+from io import StringIO
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+
+from data_loader import load_uploaded_data, latest_upload_folder
+from incremental import get_profile, profile_summary
+from phrase_mining import get_phrase_counts, get_distinctive_phrases
+from review_cube import get_review_cube, rollup, age_counts, polarity_histogram, polarity_signs, polarity_quartiles
+from segmentation import model_key, elbow_range, get_elbow_sweep, get_segments, get_reference_segments, align_labels
+from sentiment_charts import plot_age_feedback_summary
+from sentiment_scoring import sentiment_engines, get_polarity
+from shared_cache import get_artifact
+
+# Define the folder the published snapshots are written to, one file per dataset version
+report_folder = os.path.join('uploaded_files', 'reports')
+
+# Settings the snapshot is published with (the defaults of the interactive pages)
+report_clusters = 3
+report_engine = sentiment_engines[0]
+
+# Columns the cleaned-data section shows a histogram and top-5 pie for
+report_columns = ['Age', 'Rating', 'Recommended IND', 'Division Name', 'Department Name', 'Class Name']
+
+
+# Function to wrap a figure as a report item, serialised once when the snapshot is published
+def figure_item(fig):
+    return {'kind': 'figure', 'figure': fig.to_json()}
+
+
+# Function to wrap a table as a report item
+def table_item(table, title=None):
+    return {'kind': 'table', 'title': title, 'table': table.to_json(orient='split', index=False)}
+
+
+# Function to wrap a line of text as a report item
+def text_item(text):
+    return {'kind': 'text', 'text': text}
+
+
+# Function to wrap alternative item lists the viewer picks from with a select box
+def choice_item(label, options):
+    return {'kind': 'choice', 'label': label, 'options': options}
+
+
+# Function to build the raw-data section: the column profile of the uploaded file
+def data_section(data, version):
+    # Drop the index column first, as the data page does, since both read the profile cached for this version
+    data = data.drop(columns=['Unnamed: 0'], errors='ignore')
+    return {'title': 'Data Before Cleaning', 'items': [
+        text_item(f"Count before dropping NA: {len(data):,}"),
+        table_item(profile_summary(get_profile(version, data), data), 'Data Summary'),
+    ]}
+
+
+# Function to build the cleaned-data section: a histogram and a top-5 pie per column, from the review cube
+def clean_section(data, version):
+    cleaned = data.drop(columns=['Unnamed: 0'], errors='ignore').dropna().reset_index(drop=True)
+    cube = get_review_cube((version, False, 'cleaned'), cleaned)
+    options = {}
+    for column in report_columns:
+        if column != 'Age' and column not in cube['dimensions']:
+            continue
+        counts = age_counts(cube) if column == 'Age' else rollup(cube, [column])[[column, 'Count']]
+        histogram = px.histogram(counts, x=column, y='Count', histfunc='sum', title=f"Histogram of {column}",
+                                 color_discrete_sequence=['mediumslateblue'], barnorm='percent', nbins=20)
+        histogram.update_layout(bargap=0.1)
+        pie = px.pie(counts.nlargest(5, 'Count'), names=column, values='Count', title=f"Pie Chart of {column} (Top 5)",
+                     hole=0.3, color_discrete_sequence=px.colors.qualitative.Set3)
+        pie.update_traces(textposition='inside', textinfo='percent+label')
+        options[column] = [figure_item(histogram), figure_item(pie)]
+    return {'title': 'Data After Cleaning', 'items': [
+        text_item(f"Count after dropping NA: {len(cleaned):,}"),
+        choice_item('Column:', options),
+    ]}
+
+
+# Function to count identical (x, y, cluster) points so a scatter plot needs one marker per combination
+def aggregated_scatter(data, x, y, title):
+    points = data.groupby([x, y, 'Cluster']).size().reset_index(name='Reviews')
+    points['Cluster'] = points['Cluster'].astype(str)
+    return px.scatter(points, x=x, y=y, color='Cluster', size='Reviews', title=title)
+
+
+# Function to build the modelling section: the elbow sweep and the k-means segments of the default k
+def modelling_section(data, version):
+    from sklearn.metrics import silhouette_score
+    from sklearn.preprocessing import StandardScaler
+
+    numeric = data.select_dtypes(include=[np.number])
+    sse = get_elbow_sweep(model_key('elbow', version, False, False), lambda: numeric)
+    fig_elbow = px.line(x=elbow_range, y=sse, markers=True, title="Elbow Method Graph")
+    fig_elbow.update_layout(xaxis_title="Number of Clusters", yaxis_title="Sum of Squared Distances", xaxis_dtick=1)
+
+    # Same key as the modelling page, so a page run and the snapshot share one fit
+    segments = get_segments(model_key('segments', version, False, False, report_clusters), numeric, report_clusters)
+    # Numbered against the page's reference segments, so the report's clusters carry the page's ids
+    scaled = StandardScaler().fit_transform(numeric)
+    reference = get_reference_segments(model_key('kmeans_reference', version, False, False), data, scaled, report_clusters)
+    labels = align_labels(segments['labels'], reference, report_clusters)[segments['labels']]
+    clustered = numeric.assign(Cluster=labels)
+    silhouette = silhouette_score(scaled, labels)
+    statistics = clustered.groupby('Cluster').agg(['mean', 'std'])
+    statistics.columns = ['_'.join(column) for column in statistics.columns]
+    statistics = statistics.reset_index()
+
+    return {'title': 'Modelling', 'items': [
+        figure_item(fig_elbow),
+        text_item(f"K-Means with {report_clusters} clusters. Silhouette Score: {silhouette:.3f}"),
+        table_item(statistics[['Cluster'] + [c for c in statistics.columns if c.endswith('_mean')]], 'Mean Statistics by Cluster'),
+        table_item(statistics[['Cluster'] + [c for c in statistics.columns if c.endswith('_std')]], 'Standard Deviation Statistics by Cluster'),
+        figure_item(aggregated_scatter(clustered, 'Rating', 'Age', "Rating vs. Age (Colored by Cluster)")),
+        figure_item(aggregated_scatter(clustered, 'Age', 'Positive Feedback Count', "Age vs. Positive Feedback Count (Colored by Cluster)")),
+        figure_item(aggregated_scatter(clustered, 'Rating', 'Positive Feedback Count', "Rating vs. Positive Feedback Count (Colored by Cluster)")),
+    ]}
+
+
+# Function to build the sentiment section: the cube-backed charts and the distinctive phrases
+def sentiment_section(data, version):
+    review_texts = data['Review Text']
+    scored = data.drop(columns=['Unnamed: 0'], errors='ignore')
+    scored['Review Text'] = scored['Review Text'].astype(str)
+    scored['polarity'] = get_polarity(version, review_texts, report_engine).reindex(scored.index)
+    scored = scored.dropna()
+    cube = get_review_cube((version, False, report_engine, None), scored)
+
+    fig_ratings = px.bar(rollup(cube, ['Rating']), x='Rating', y='Count', title='Count of Ratings')
+    fig_class = px.bar(rollup(cube, ['Class Name']), x='Class Name', y='Count',
+                       title='Count of Reviews by Class Name', color='Class Name')
+    quartiles = polarity_quartiles(cube, 'Department Name')
+    fig_department = go.Figure([
+        go.Box(name=str(row['Department Name']), x=[str(row['Department Name'])], q1=[row['q1']], median=[row['median']],
+               q3=[row['q3']], lowerfence=[row['min']], upperfence=[row['max']])
+        for _, row in quartiles.iterrows()
+    ])
+    fig_department.update_layout(title_text='Polarity by Department Name', xaxis_title='Department Name', yaxis_title='polarity')
+    fig_polarity = px.bar(polarity_histogram(cube, 40), x='polarity', y='Count', title='Distribution of Polarity')
+    fig_polarity.update_layout(bargap=0)
+    signs = polarity_signs(cube).sort_values(ascending=False)
+    fig_pie = go.Figure(data=[go.Pie(labels=signs.index, values=signs, hole=.3)])
+    fig_pie.update_layout(title_text='Polarity Distribution')
+
+    # Phrase rankings for every group, so the viewer only switches between stored tables
+    breakdowns = scored[['Department Name', 'Class Name']].copy()
+    breakdowns['Polarity Bucket'] = pd.cut(scored['polarity'], [-1.01, -1e-12, 1e-12, 1.01],
+                                           labels=['Negative', 'Neutral', 'Positive']).astype(str)
+    # Same key as the sentiment page with its default settings, so the page and the snapshot share one ranking
+    rankings_by_column = get_distinctive_phrases((version, False, report_engine, None), breakdowns,
+                                                 get_phrase_counts(version, review_texts))
+    phrases = {}
+    for column, rankings in rankings_by_column.items():
+        for group in sorted(rankings, key=str):
+            phrases[f"{column}: {group}"] = [table_item(rankings[group])]
+
+    return {'title': 'Sentiment Analysis', 'items': [
+        figure_item(fig_ratings),
+        figure_item(fig_class),
+        figure_item(plot_age_feedback_summary(scored)),
+        figure_item(fig_department),
+        figure_item(fig_polarity),
+        figure_item(fig_pie),
+        text_item("Distinctive phrases (ranked by a log-odds score against all other reviews):"),
+        choice_item('Group:', phrases),
+    ]}
+
+
+# Function to render every page of the report for a dataset version and write it to one JSON file
+def publish_snapshot(data, version, folder=report_folder):
+    start = time.perf_counter()
+    snapshot = {
+        'version': version,
+        'rows': len(data),
+        'settings': {'clusters': report_clusters, 'sentiment_engine': report_engine},
+        'sections': [
+            data_section(data, version),
+            clean_section(data, version),
+            modelling_section(data, version),
+            sentiment_section(data, version),
+        ],
+    }
+    snapshot['published'] = time.strftime('%Y-%m-%d %H:%M:%S')
+    snapshot['build_seconds'] = round(time.perf_counter() - start, 1)
+
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, f"{version}.report.json")
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    with open(temporary_path, 'w') as f:
+        json.dump(snapshot, f)
+    os.replace(temporary_path, path)
+    return path
+
+
+# Function to list the published snapshots, newest first
+def list_snapshots(folder=report_folder):
+    if not os.path.exists(folder):
+        return []
+    paths = [os.path.join(folder, file) for file in os.listdir(folder) if file.endswith('.report.json')]
+    return sorted(paths, key=os.path.getmtime, reverse=True)
+
+
+# Function to find the snapshot of a dataset version, if one was published
+def snapshot_path(version, folder=report_folder):
+    path = os.path.join(folder, f"{version}.report.json")
+    return path if os.path.exists(path) else None
+
+
+# Function to parse a snapshot file, turning its figures and tables back into objects
+def read_snapshot(path):
+    import plotly.io as pio
+
+    def restore(items):
+        for item in items:
+            if item['kind'] == 'figure':
+                item['figure'] = pio.from_json(item['figure'])
+            elif item['kind'] == 'table':
+                item['table'] = pd.read_json(StringIO(item['table']), orient='split')
+            elif item['kind'] == 'choice':
+                for options in item['options'].values():
+                    restore(options)
+
+    with open(path) as f:
+        snapshot = json.load(f)
+    for section in snapshot['sections']:
+        restore(section['items'])
+    return snapshot
+
+
+# Function to load a snapshot once per file version, shared by every viewer
+def load_snapshot(path):
+    return get_artifact(('report', path, os.path.getmtime(path)), read_snapshot, path)
+
+
+if __name__ == "__main__":
+    # Publish the snapshot of the latest upload, e.g. from a scheduled job after a new export
+    folder = latest_upload_folder()
+    data, version = load_uploaded_data(folder) if folder is not None else (None, None)
+    if data is None:
+        print("No CSV files found in the 'uploaded_files' folder.")
+    else:
+        print(f"Published {publish_snapshot(data, version)}")
@@ -0,0 +1,174 @@
+import numpy as np
+import pandas as pd
+
+from shared_cache import get_artifact
+
+# Dimensions of the cube; Cluster is added when segments are attached to the reviews
+cube_dimensions = ['Division Name', 'Department Name', 'Class Name', 'Rating', 'Recommended IND', 'Age Band']
+
+# Age bands used as a dimension (the exact ages are kept in a per-cell histogram)
+age_band_edges = [0, 25, 35, 45, 55, 65, np.inf]
+age_band_labels = ['Under 25', '25-34', '35-44', '45-54', '55-64', '65+']
+
+# Polarity sketch: a fixed histogram over [-1, 1] per cell, fine enough for quartiles
+n_polarity_bins = 200
+polarity_edges = np.linspace(-1.0, 1.0, n_polarity_bins + 1)
+
+
+# Function to sum per-row values into per-cell (or per-cell x bin) totals
+def _cell_totals(cells, n_cells, values=None, bins=None, n_bins=1):
+    index = cells if bins is None else cells * n_bins + bins
+    totals = np.bincount(index, weights=values, minlength=n_cells * n_bins)
+    return totals.reshape(n_cells, n_bins) if bins is not None else totals
+
+
+# Function to aggregate the reviews into cells of every dimension combination that occurs
+def build_cube(data):
+    frame = data.copy()
+    if 'Age' in frame.columns:
+        frame['Age Band'] = pd.cut(frame['Age'], age_band_edges, labels=age_band_labels, right=False)
+    dimensions = [column for column in cube_dimensions if column in frame.columns]
+    if 'Cluster' in frame.columns:
+        dimensions.append('Cluster')
+
+    categories, codes = {}, []
+    for column in dimensions:
+        column_codes, column_categories = pd.factorize(frame[column], sort=True)
+        column_categories = np.asarray(column_categories, dtype=object)
+        if (column_codes < 0).any():
+            column_codes = np.where(column_codes < 0, len(column_categories), column_codes)
+            column_categories = np.append(column_categories, 'Unknown')
+        categories[column] = column_categories
+        codes.append(column_codes)
+    cell_codes, cells = np.unique(np.stack(codes, axis=1), axis=0, return_inverse=True)
+    cells = cells.ravel()
+    n_cells = len(cell_codes)
+
+    cube = {
+        'dimensions': dimensions,
+        'categories': categories,
+        'cell_codes': cell_codes.astype(np.int16),
+        'count': _cell_totals(cells, n_cells).astype(np.int64),
+    }
+    if 'Positive Feedback Count' in frame.columns:
+        cube['feedback_sum'] = _cell_totals(cells, n_cells, frame['Positive Feedback Count'].fillna(0).to_numpy(float))
+    if 'Age' in frame.columns:
+        ages = frame['Age'].fillna(-1).astype(int).to_numpy()
+        age_codes, age_values = pd.factorize(ages, sort=True)
+        cube['age_values'] = np.asarray(age_values)
+        cube['age_hist'] = _cell_totals(cells, n_cells, bins=age_codes, n_bins=len(age_values)).astype(np.uint32)
+    if 'polarity' in frame.columns:
+        polarity = frame['polarity'].fillna(0).to_numpy(float)
+        bins = np.clip(np.searchsorted(polarity_edges, polarity, side='right') - 1, 0, n_polarity_bins - 1)
+        signs = np.sign(polarity).astype(int) + 1
+        cube['polarity_sum'] = _cell_totals(cells, n_cells, polarity)
+        cube['polarity_hist'] = _cell_totals(cells, n_cells, bins=bins, n_bins=n_polarity_bins).astype(np.uint32)
+        cube['polarity_signs'] = _cell_totals(cells, n_cells, bins=signs, n_bins=3).astype(np.int64)
+    return cube
+
+
+# Function to keep the rows of a frame matching the same filters, for charts drawn from individual reviews
+def filter_rows(data, filters):
+    keep = pd.Series(True, index=data.index)
+    for column, allowed in (filters or {}).items():
+        if not allowed:
+            continue
+        if column == 'Age Band' and 'Age' in data.columns:
+            values = pd.cut(data['Age'], age_band_edges, labels=age_band_labels, right=False).astype(object)
+        elif column in data.columns:
+            values = data[column].astype(object)
+        else:
+            continue
+        # Missing values fall in the cube's 'Unknown' category
+        keep &= values.where(values.notna(), 'Unknown').isin(list(allowed))
+    return data[keep]
+
+
+# Function to pick the cells matching filters given as {dimension: allowed values}
+def _matching_cells(cube, filters):
+    keep = np.ones(len(cube['count']), dtype=bool)
+    for column, allowed in (filters or {}).items():
+        if not allowed or column not in cube['categories']:
+            continue
+        allowed_codes = np.flatnonzero(np.isin(cube['categories'][column], list(allowed)))
+        keep &= np.isin(cube['cell_codes'][:, cube['dimensions'].index(column)], allowed_codes)
+    return keep
+
+
+# Function to roll the cube up to some dimensions, summing per-cell measures over the other ones
+def _rollup_measures(cube, by, measures, filters=None):
+    keep = _matching_cells(cube, filters)
+    sizes = [len(cube['categories'][column]) for column in by]
+    cell_codes = cube['cell_codes'][keep]
+    combined = np.ravel_multi_index(tuple(cell_codes[:, cube['dimensions'].index(column)] for column in by), sizes) \
+        if by else np.zeros(len(cell_codes), dtype=np.int64)
+    group_ids, groups = np.unique(combined, return_inverse=True)
+    group_codes = np.unravel_index(group_ids, sizes) if by else ()
+
+    # Sort the cells by group so each group's total is one contiguous reduction
+    order = np.argsort(groups, kind='stable')
+    starts = np.searchsorted(groups[order], np.arange(len(group_ids)))
+    totals = {}
+    for measure in measures:
+        values = cube[measure][keep][order]
+        totals[measure] = np.add.reduceat(values, starts, axis=0) if len(values) else values[:0]
+    labels = {column: cube['categories'][column][codes] for column, codes in zip(by, group_codes)}
+    return labels, totals
+
+
+# Function to get counts (and feedback and polarity totals) for every group of some dimensions
+def rollup(cube, by, filters=None):
+    measures = [measure for measure in ('count', 'feedback_sum', 'polarity_sum') if measure in cube]
+    labels, totals = _rollup_measures(cube, by, measures, filters)
+    labels['Count'] = totals['count']
+    if 'feedback_sum' in totals:
+        labels['Positive Feedback Sum'] = totals['feedback_sum']
+    if 'polarity_sum' in totals:
+        labels['Mean Polarity'] = totals['polarity_sum'] / np.maximum(totals['count'], 1)
+    return pd.DataFrame(labels)
+
+
+# Function to get the number of reviews at every exact age
+def age_counts(cube, filters=None):
+    keep = _matching_cells(cube, filters)
+    return pd.DataFrame({'Age': cube['age_values'], 'Count': cube['age_hist'][keep].sum(axis=0).astype(np.int64)})
+
+
+# Function to get the polarity histogram, merged into a coarser number of equal-width bins
+def polarity_histogram(cube, n_bins=40, filters=None):
+    keep = _matching_cells(cube, filters)
+    counts = cube['polarity_hist'][keep].sum(axis=0).reshape(n_bins, -1).sum(axis=1)
+    edges = np.linspace(-1.0, 1.0, n_bins + 1)
+    return pd.DataFrame({'polarity': (edges[:-1] + edges[1:]) / 2, 'Count': counts.astype(np.int64)})
+
+
+# Function to count negative, neutral and positive reviews
+def polarity_signs(cube, filters=None):
+    keep = _matching_cells(cube, filters)
+    return pd.Series(cube['polarity_signs'][keep].sum(axis=0), index=['Negative', 'Neutral', 'Positive'])
+
+
+# Function to estimate polarity quartiles and range per group from the histogram sketches
+def polarity_quartiles(cube, by, filters=None):
+    labels, totals = _rollup_measures(cube, [by], ['polarity_hist'], filters)
+    labels = pd.DataFrame(labels)
+    histograms = totals['polarity_hist']
+    cumulative = np.cumsum(histograms, axis=1)
+    totals = cumulative[:, -1:].astype(float)
+    centres = (polarity_edges[:-1] + polarity_edges[1:]) / 2
+
+    def quantile(q):
+        return centres[np.argmax(cumulative >= np.maximum(q * totals, 1), axis=1)]
+
+    occupied = histograms > 0
+    labels['min'] = centres[np.argmax(occupied, axis=1)]
+    labels['q1'] = quantile(0.25)
+    labels['median'] = quantile(0.5)
+    labels['q3'] = quantile(0.75)
+    labels['max'] = centres[n_polarity_bins - 1 - np.argmax(occupied[:, ::-1], axis=1)]
+    return labels
+
+
+# Function to build the cube once per dataset version and settings, shared by every session
+def get_review_cube(key, data):
+    return get_artifact(('cube',) + tuple(key), build_cube, data)
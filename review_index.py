@@ -0,0 +1,174 @@
+import os
+import re
+from functools import reduce
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from shared_cache import get_artifact
+
+# Define the folder the persisted indexes are written to, one file per dataset version
+index_folder = os.path.join('uploaded_files', 'indexes')
+
+# Columns that are searchable, and how a word is recognised in them
+indexed_columns = ['Review Text', 'Title']
+token_pattern = r"[a-z0-9]+(?:'[a-z]+)?"
+
+# Query syntax: quoted phrases, bare words, AND / OR / NOT and a leading '-' for exclusion
+query_pattern = re.compile(r'"([^"]*)"|(\S+)')
+
+
+# Function to split a text column into (row, position, word) triples
+def _tokenize(texts, offset):
+    words = texts.fillna('').astype(str).str.lower().str.findall(token_pattern)
+    lengths = words.str.len().to_numpy()
+    flat = words.explode().dropna()
+    rows = flat.index.to_numpy()
+    positions = flat.groupby(level=0).cumcount().to_numpy() + offset[rows]
+    return rows, positions, flat.to_numpy(dtype=object), lengths
+
+
+# Function to build a positional inverted index over the review text and title columns
+def build_review_index(data):
+    n_rows = len(data)
+    offset = np.zeros(n_rows, dtype=np.int64)
+    rows, positions, words = [], [], []
+    for column in indexed_columns:
+        if column not in data.columns:
+            continue
+        column_rows, column_positions, column_words, lengths = _tokenize(data[column].reset_index(drop=True), offset)
+        rows.append(column_rows)
+        positions.append(column_positions)
+        words.append(column_words)
+        # Leave a gap between fields so a phrase cannot run from the text into the title
+        offset = offset + lengths + 1
+
+    rows = np.concatenate(rows) if rows else np.array([], dtype=np.int64)
+    positions = np.concatenate(positions) if positions else np.array([], dtype=np.int64)
+    words = np.concatenate(words) if words else np.array([], dtype=object)
+    term_ids, vocabulary = pd.factorize(words)
+
+    # Postings sorted by term, then row, then position
+    order = np.lexsort((positions, rows, term_ids))
+    term_ids, rows, positions = term_ids[order], rows[order], positions[order]
+    all_terms = np.arange(len(vocabulary) + 1)
+
+    # Row postings keep each (term, row) pair once, for boolean queries
+    first = np.ones(len(term_ids), dtype=bool)
+    first[1:] = (term_ids[1:] != term_ids[:-1]) | (rows[1:] != rows[:-1])
+
+    return {
+        'vocabulary': np.asarray(vocabulary, dtype=str),
+        'row_offsets': np.searchsorted(term_ids[first], all_terms),
+        'row_postings': rows[first].astype(np.int32),
+        'position_offsets': np.searchsorted(term_ids, all_terms),
+        'position_rows': rows.astype(np.int32),
+        'position_postings': positions.astype(np.int32),
+        'n_rows': np.array(n_rows),
+    }
+
+
+# Function to load the index for a dataset version from disk, building and saving it the first time
+def load_review_index(version, data, folder=index_folder):
+    path = os.path.join(folder, f"{version}.npz")
+    if os.path.exists(path):
+        with np.load(path) as stored:
+            index = {name: stored[name] for name in stored.files}
+    else:
+        index = build_review_index(data)
+        os.makedirs(folder, exist_ok=True)
+        temporary_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(temporary_path, **index)
+        os.replace(temporary_path, path)
+    index['lookup'] = pd.Index(index['vocabulary'])
+    return index
+
+
+# Function to parse a query into OR-ed clauses of (negated, words) items
+def parse_query(query):
+    clauses = [[]]
+    negate = False
+    for phrase, word in query_pattern.findall(query):
+        if word == 'OR':
+            clauses.append([])
+            continue
+        if word == 'AND':
+            continue
+        if word == 'NOT':
+            negate = True
+            continue
+        if word.startswith('-') and len(word) > 1:
+            negate = True
+            word = word[1:]
+        words = re.findall(token_pattern, (phrase or word).lower())
+        if words:
+            clauses[-1].append((negate, words))
+        negate = False
+    return [clause for clause in clauses if clause]
+
+
+# Function to get the rows containing a word
+def _word_rows(index, word):
+    term = index['lookup'].get_indexer([word])[0]
+    if term < 0:
+        return np.array([], dtype=np.int32)
+    return index['row_postings'][index['row_offsets'][term]:index['row_offsets'][term + 1]]
+
+
+# Function to get the rows containing the words of a phrase next to each other
+def _phrase_rows(index, words):
+    candidates = reduce(np.intersect1d, [_word_rows(index, word) for word in words])
+    if len(words) == 1 or len(candidates) == 0:
+        return candidates
+
+    stride = np.int64(index['position_postings'].max()) + 1
+    starts = None
+    for k, word in enumerate(words):
+        term = index['lookup'].get_indexer([word])[0]
+        postings = slice(index['position_offsets'][term], index['position_offsets'][term + 1])
+        rows = index['position_rows'][postings].astype(np.int64)
+        positions = index['position_postings'][postings].astype(np.int64)
+        keep = np.isin(rows, candidates) & (positions >= k)
+        # Encode where the phrase would start if this word is its k-th word
+        keys = rows[keep] * stride + positions[keep] - k
+        starts = keys if starts is None else np.intersect1d(starts, keys)
+    return np.unique(starts // stride)
+
+
+# Function to find the rows matching a boolean / phrase query
+def search(index, query):
+    result = np.array([], dtype=np.int64)
+    for clause in parse_query(query):
+        included = [_phrase_rows(index, words) for negate, words in clause if not negate]
+        rows = reduce(np.intersect1d, included) if included else np.arange(int(index['n_rows']))
+        for negate, words in clause:
+            if negate:
+                rows = np.setdiff1d(rows, _phrase_rows(index, words))
+        result = np.union1d(result, rows)
+    return result
+
+
+# Function to search reviews, filter the hits and return one page of them with the total count
+def search_reviews(index, data, query, departments=None, classes=None, polarity_range=None,
+                   clusters=None, page=1, page_size=20):
+    hits = search(index, query)
+    matches = data.loc[data.index.intersection(hits)]
+
+    if departments:
+        matches = matches[matches['Department Name'].isin(departments)]
+    if classes:
+        matches = matches[matches['Class Name'].isin(classes)]
+    if polarity_range is not None and 'polarity' in matches.columns:
+        matches = matches[matches['polarity'].between(*polarity_range)]
+    if clusters and 'Cluster' in matches.columns:
+        matches = matches[matches['Cluster'].isin(clusters)]
+
+    start = (page - 1) * page_size
+    return len(matches), matches.iloc[start:start + page_size]
+
+
+# Function to keep one loaded index per dataset version in memory for every session
+def get_review_index(version, data):
+    with st.spinner("Indexing reviews..."):
+        return get_artifact(('review_index', version), load_review_index, version, data)
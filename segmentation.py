@@ -0,0 +1,182 @@
+import numpy as np
+
+from incremental import parent_artifact, population_stability, feature_drift, psi_threshold, distance_ratio_threshold
+from shared_cache import get_artifact
+
+# Range of k tried by the elbow sweep
+elbow_range = range(1, 11)
+
+
+# Function to key cached modelling artifacts by the dataset and every setting that changes the feature matrix
+def model_key(name, version, dedupe_threshold, use_text_features, *params):
+    return (name, version, dedupe_threshold, use_text_features) + params
+
+
+# Function to get the cached artifact of the dataset this one was appended to (never with dedup, which drops rows)
+def _appended_from(key):
+    if key[2]:
+        return None, 0
+    return parent_artifact(key)
+
+
+# Function to fit k-means for every k of the elbow range and collect the sum of squared distances
+def elbow_sweep(features):
+    from sklearn.cluster import KMeans
+
+    sse = []
+    for k in elbow_range:
+        kmeans = KMeans(n_clusters=k, random_state=0)
+        kmeans.fit(features)
+        sse.append(kmeans.inertia_)
+    return sse
+
+
+# Function to run the sweep, reusing the parent's sweep when appended rows look like the existing ones
+def sweep_dataset(key, compute_features):
+    features = np.asarray(compute_features(), dtype=float)
+    previous, start = _appended_from(key)
+    if previous is not None and feature_drift(features[:start], features[start:]) <= psi_threshold:
+        return previous
+    return elbow_sweep(features)
+
+
+# Function to run the elbow sweep once per dataset and settings, shared by every session
+def get_elbow_sweep(key, compute_features):
+    return get_artifact(key, sweep_dataset, key, compute_features)
+
+
+# Function to compute the squared distance of every row to every centroid without an n x k x p temporary
+def _squared_distances(features, centroids):
+    distances = (features ** 2).sum(axis=1)[:, None] - 2 * features @ centroids.T + (centroids ** 2).sum(axis=1)[None, :]
+    return np.maximum(distances, 0)
+
+
+# Function to derive starting centroids for k clusters from a fit with a neighbouring k:
+# the cluster with the largest squared error is split, or the two closest centroids are merged, until k remain
+def warm_start_centroids(features, n_clusters, centroids):
+    features = np.asarray(features, dtype=float)
+    centroids = np.asarray(centroids, dtype=float)
+    while len(centroids) != n_clusters:
+        distances = _squared_distances(features, centroids)
+        labels = distances.argmin(axis=1)
+        if len(centroids) < n_clusters:
+            errors = np.bincount(labels, weights=distances[np.arange(len(features)), labels], minlength=len(centroids))
+            worst = int(errors.argmax())
+            members = features[labels == worst]
+            # Split the worst cluster in two along the spread of its members
+            offset = members.std(axis=0) / 2 if len(members) > 1 else np.full(features.shape[1], 1e-3)
+            centroids = np.vstack([np.delete(centroids, worst, axis=0), centroids[worst] - offset, centroids[worst] + offset])
+        else:
+            sizes = np.bincount(labels, minlength=len(centroids)) + 1.0
+            gaps = _squared_distances(centroids, centroids)
+            gaps[np.diag_indices_from(gaps)] = np.inf
+            first, second = np.unravel_index(gaps.argmin(), gaps.shape)
+            # Merge the two closest clusters into their size-weighted mean
+            merged = (centroids[first] * sizes[first] + centroids[second] * sizes[second]) / (sizes[first] + sizes[second])
+            centroids = np.vstack([np.delete(centroids, [first, second], axis=0), merged])
+    return centroids
+
+
+# Function to fit k-means, starting from the centroids of a neighbouring k when they are given
+def fit_kmeans(features, n_clusters, neighbour_centroids=None):
+    from sklearn.cluster import KMeans
+
+    if neighbour_centroids is None or len(neighbour_centroids) == n_clusters:
+        return KMeans(n_clusters=n_clusters, random_state=0).fit(features)
+    init = warm_start_centroids(features, n_clusters, neighbour_centroids)
+    return KMeans(n_clusters=n_clusters, init=init, n_init=1, random_state=0).fit(features)
+
+
+# Function to find the cached centroids of the k closest to the requested one (fewer clusters first on ties)
+def nearest_cached_centroids(centroids_by_k, n_clusters):
+    candidates = [k for k in centroids_by_k if k != n_clusters]
+    if not candidates:
+        return None
+    return centroids_by_k[min(candidates, key=lambda k: (abs(k - n_clusters), k))]
+
+
+# Function to number a cold k-means fit the way the k-means commentary reads: the cluster with the lowest
+# mean rating first, then the others by the spread of their positive feedback
+def reference_segments(data, features, n_clusters):
+    labels = fit_kmeans(features, n_clusters).labels_
+    clusters = data[['Rating', 'Positive Feedback Count']].assign(Cluster=labels).groupby('Cluster')
+    rating, spread = clusters['Rating'].mean(), clusters['Positive Feedback Count'].std()
+    lowest = rating.idxmin()
+    order = [lowest] + sorted((cluster for cluster in rating.index if cluster != lowest), key=lambda cluster: spread[cluster])
+    ids = np.empty(len(order), dtype=np.int64)
+    ids[order] = np.arange(len(order))
+    return ids[labels]
+
+
+# Function to get the reference labels every k-means result is numbered against, shared by the page and the report
+def get_reference_segments(key, data, features, n_clusters):
+    return get_artifact(key, reference_segments, data, features, n_clusters)
+
+
+# Function to renumber cluster labels so each cluster takes the id of the reference segment it overlaps most;
+# with more clusters than the reference has, the previous labels count as well, so the clusters beyond the
+# reference keep the ids an earlier k gave them and a cluster that splits passes its id on to its larger part
+def align_labels(labels, reference, n_clusters, previous=None):
+    from scipy.optimize import linear_sum_assignment
+
+    # Reference ids beyond k cannot be used, so those rows do not count
+    keep = reference < n_clusters
+    overlap = np.zeros((n_clusters, n_clusters))
+    np.add.at(overlap, (labels[keep], reference[keep]), 1)
+    if previous is not None and n_clusters > reference.max() + 1:
+        keep = previous < n_clusters
+        np.add.at(overlap, (labels[keep], previous[keep]), 1)
+    new_ids, reference_ids = linear_sum_assignment(overlap, maximize=True)
+    mapping = np.empty(n_clusters, dtype=np.int64)
+    mapping[new_ids] = reference_ids
+    return mapping
+
+
+# Function to fit k-means segments on standardised features, keeping the scaler to place new rows later
+def fit_segments(features, n_clusters, neighbour_centroids=None):
+    from sklearn.preprocessing import StandardScaler
+
+    scaler = StandardScaler().fit(features)
+    scaled = scaler.transform(features)
+    model = fit_kmeans(scaled, n_clusters, neighbour_centroids)
+    return {
+        'scaler': scaler,
+        'model': model,
+        'labels': model.labels_,
+        'reference_distance': float(model.transform(scaled).min(axis=1).mean()),
+        'assigned_rows': 0,
+        'drift': None,
+        'refit': True,
+    }
+
+
+# Function to place appended rows in the saved segments, refitting only when they drift too far
+def extend_segments(previous, features, start, n_clusters):
+    scaled = previous['scaler'].transform(features[start:])
+    labels = previous['model'].predict(scaled)
+    distances = previous['model'].transform(scaled).min(axis=1)
+    drift = {
+        'label_psi': population_stability(np.bincount(previous['labels'], minlength=n_clusters),
+                                          np.bincount(labels, minlength=n_clusters)),
+        'distance_ratio': float(distances.mean() / previous['reference_distance']),
+    }
+    if drift['label_psi'] > psi_threshold or drift['distance_ratio'] > distance_ratio_threshold:
+        segments = fit_segments(features, n_clusters)
+        segments['drift'] = drift
+        return segments
+    return dict(previous, labels=np.concatenate([previous['labels'], labels]),
+                assigned_rows=previous['assigned_rows'] + len(labels), drift=drift, refit=False)
+
+
+# Function to segment a dataset version, extending the parent's segments when rows were only appended
+def segment_dataset(key, features, n_clusters, neighbour_centroids=None):
+    features = np.asarray(features, dtype=float)
+    previous, start = _appended_from(key)
+    if previous is None:
+        return fit_segments(features, n_clusters, neighbour_centroids)
+    return extend_segments(previous, features, start, n_clusters)
+
+
+# Function to get the k-means segments of a dataset version from the shared cache
+def get_segments(key, features, n_clusters, neighbour_centroids=None):
+    return get_artifact(key, segment_dataset, key, features, n_clusters, neighbour_centroids)
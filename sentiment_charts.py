@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+import streamlit as st
+
+# Only these columns are hashed by the caches below, so the review text never is
+trend_columns = ['Age', 'Positive Feedback Count']
+
+
+# Function to fit Positive Feedback Count against Age with NumPy least squares (cached per dataset)
+@st.cache_data(show_spinner=False)
+def fit_age_feedback_trend(data):
+    age = data['Age'].to_numpy(dtype=float)
+    feedback = data['Positive Feedback Count'].to_numpy(dtype=float)
+    design = np.column_stack([np.ones_like(age), age])
+    (intercept, slope), *_ = np.linalg.lstsq(design, feedback, rcond=None)
+    return float(intercept), float(slope)
+
+
+# Function to summarise Positive Feedback Count for every age (cached per dataset)
+@st.cache_data(show_spinner=False)
+def age_feedback_summary(data):
+    grouped = data.groupby('Age')['Positive Feedback Count']
+    summary = pd.DataFrame({
+        'mean': grouped.mean(),
+        'count': grouped.size(),
+        'p25': grouped.quantile(0.25),
+        'p75': grouped.quantile(0.75),
+    })
+    return summary.reset_index()
+
+
+# Function to plot per-age means with their interquartile band and the fitted trend line
+def plot_age_feedback_summary(data):
+    summary = age_feedback_summary(data[trend_columns])
+    intercept, slope = fit_age_feedback_trend(data[trend_columns])
+
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(x=summary['Age'], y=summary['p75'], mode='lines',
+                             line=dict(width=0), showlegend=False, hoverinfo='skip'))
+    fig.add_trace(go.Scatter(x=summary['Age'], y=summary['p25'], mode='lines', fill='tonexty',
+                             line=dict(width=0), fillcolor='rgba(123, 104, 238, 0.25)',
+                             name='25th-75th percentile'))
+    fig.add_trace(go.Scatter(
+        x=summary['Age'], y=summary['mean'], mode='markers', name='Mean per age',
+        marker=dict(size=summary['count'], sizemode='area',
+                    sizeref=2.0 * summary['count'].max() / 20 ** 2, sizemin=3,
+                    color=summary['Age'], colorscale='Plasma'),
+        customdata=summary['count'],
+        hovertemplate='Age %{x}<br>Mean feedback %{y:.2f}<br>Reviews %{customdata}<extra></extra>',
+    ))
+    ages = np.array([summary['Age'].min(), summary['Age'].max()])
+    fig.add_trace(go.Scatter(x=ages, y=intercept + slope * ages, mode='lines', name='OLS trend',
+                             line=dict(color='mediumslateblue')))
+    fig.update_layout(title='Age vs Positive Feedback Count', xaxis_title='Age',
+                      yaxis_title='Positive Feedback Count')
+    return fig
+
+
+# Function to plot every review, with the cached trend line instead of Plotly's own OLS fit
+def plot_age_feedback_reviews(data):
+    intercept, slope = fit_age_feedback_trend(data[trend_columns])
+    fig = px.scatter(data, x='Age', y='Positive Feedback Count',
+                     title='Age vs Positive Feedback Count',
+                     color='Age', size='Positive Feedback Count', hover_data=['Class Name'])
+    ages = np.array([data['Age'].min(), data['Age'].max()])
+    fig.add_trace(go.Scatter(x=ages, y=intercept + slope * ages, mode='lines', name='OLS trend',
+                             line=dict(color='mediumslateblue'), showlegend=False))
+    return fig
+
+
+# Function to run the full statsmodels OLS fit, only when its diagnostics are requested
+def age_feedback_diagnostics(data):
+    import statsmodels.api as sm
+
+    model = sm.OLS(data['Positive Feedback Count'].astype(float), sm.add_constant(data['Age'].astype(float)))
+    return model.fit().summary()
@@ -0,0 +1,102 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from lexicon_polarity import score_lexicon
+from polarity_cache import cached_sentiment
+from shared_cache import get_artifact
+
+# Sentiment engines offered on the sentiment page; both give the same scores
+sentiment_engines = ("TextBlob (cached)", "Vectorized lexicon")
+
+# Reviews per task sent to a worker; large enough to amortise the pickling round trip
+chunk_size = 2000
+
+# Below this many reviews the pool overhead outweighs the gain, so score in-process
+min_parallel_reviews = 4 * chunk_size
+
+# Pool shared by every rerun in this server process, so workers stay warm
+_executor = None
+_executor_lock = threading.Lock()
+
+
+# Function to load TextBlob's lexicon once when a worker starts
+def _warm_worker():
+    from textblob import TextBlob
+
+    TextBlob("good").sentiment
+
+
+# Function to score one chunk of reviews, returning (polarity, subjectivity) pairs in order
+def _score_chunk(texts):
+    from textblob import TextBlob
+
+    return [tuple(TextBlob(text).sentiment) for text in texts]
+
+
+# Function to create the worker pool on first use and reuse it afterwards
+def get_executor(max_workers=None):
+    global _executor
+    # Sessions and the warm-up thread may ask at the same time; only one of them creates the pool
+    with _executor_lock:
+        if _executor is None:
+            # Spawned workers are safe to start from the threaded Streamlit server
+            _executor = ProcessPoolExecutor(
+                max_workers=max_workers or os.cpu_count(),
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_warm_worker,
+            )
+        return _executor
+
+
+# Function to stop the worker pool (e.g. when the server shuts down)
+def shutdown_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(cancel_futures=True)
+            _executor = None
+
+
+# Function to score a column of reviews in chunks across CPU cores
+def score_parallel(texts):
+    texts = texts.astype(str)
+    values = texts.tolist()
+
+    if len(values) < min_parallel_reviews:
+        scores = _score_chunk(values)
+    else:
+        chunks = [values[start:start + chunk_size] for start in range(0, len(values), chunk_size)]
+        # map() yields chunk results in submission order, so rows stay aligned
+        scores = [score for chunk in get_executor().map(_score_chunk, chunks) for score in chunk]
+
+    return pd.DataFrame(scores, columns=['polarity', 'subjectivity'], index=texts.index)
+
+
+# Function to score every review of the dataset with the chosen sentiment engine
+def score_polarity(texts, sentiment_engine):
+    texts = texts.astype(str)
+    if sentiment_engine == "Vectorized lexicon":
+        return score_lexicon(texts)['polarity']
+    # Reviews scored on an earlier visit are read back from the on-disk cache,
+    # new ones are scored in parallel across CPU cores
+    return cached_sentiment(texts, scorer=score_parallel)['polarity']
+
+
+# Function to score a dataset version, scoring only the appended reviews when the parent's scores are cached
+def score_dataset(key, texts, sentiment_engine):
+    from incremental import parent_artifact
+
+    previous, start = parent_artifact(key)
+    if previous is None:
+        return score_polarity(texts, sentiment_engine)
+    return pd.concat([previous, score_polarity(texts.iloc[start:], sentiment_engine)])
+
+
+# Function to score a dataset version once per engine and share the scores with every session
+def get_polarity(version, texts, sentiment_engine):
+    key = ('polarity', version, sentiment_engine)
+    return get_artifact(key, score_dataset, key, texts, sentiment_engine)
@@ -0,0 +1,131 @@
+import os
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+# Memory budget shared by every cached dataset and artifact in this server process
+memory_limit = int(os.environ.get('ARTIFACT_CACHE_MB', '2048')) * 2 ** 20
+
+# Cached artifacts in least- to most-recently-used order, as key -> (value, size in bytes)
+_entries = OrderedDict()
+
+# Artifacts being computed right now, as key -> Future the other sessions wait on
+_in_flight = {}
+
+_lock = threading.Lock()
+_stats = {'bytes': 0, 'hits': 0, 'misses': 0, 'evictions': 0}
+
+# Marks a computation that failed, so a waiting session retries it instead of reusing the error
+_failed = object()
+
+
+# Function to estimate how much memory an artifact holds (objects reachable twice are counted once)
+def artifact_size(value, seen=None):
+    seen = set() if seen is None else seen
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, (pd.Series, pd.Index)):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    if sp.issparse(value):
+        return sum(int(getattr(value, name).nbytes) for name in ('data', 'indices', 'indptr', 'row', 'col')
+                   if hasattr(value, name))
+    if isinstance(value, dict):
+        return sum(artifact_size(item, seen) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(artifact_size(item, seen) for item in value)
+    # Plotly figures are measured by their data rather than their (deep) object graph
+    if hasattr(value, 'to_plotly_json'):
+        return artifact_size(value.to_plotly_json(), seen)
+    # Fitted models keep their learned arrays as attributes
+    if hasattr(value, '__dict__'):
+        return sys.getsizeof(value) + sum(artifact_size(item, seen) for item in vars(value).values())
+    return sys.getsizeof(value)
+
+
+# Function to add an artifact, evicting the least recently used ones to stay under the budget
+def _store(key, value, size):
+    if size > memory_limit:
+        return
+    while _entries and _stats['bytes'] + size > memory_limit:
+        _, (_, evicted_size) = _entries.popitem(last=False)
+        _stats['bytes'] -= evicted_size
+        _stats['evictions'] += 1
+    _entries[key] = (value, size)
+    _stats['bytes'] += size
+
+
+# Function to return a cached artifact, computing it once even when several sessions ask at the same time
+def get_artifact(key, compute, *args):
+    while True:
+        with _lock:
+            if key in _entries:
+                _entries.move_to_end(key)
+                _stats['hits'] += 1
+                return _entries[key][0]
+            future = _in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                _in_flight[key] = future
+                _stats['misses'] += 1
+
+        if not owner:
+            value = future.result()
+            if value is _failed:
+                continue
+            return value
+
+        # Whatever fails (computing, measuring or storing), the waiting sessions are released
+        result = _failed
+        try:
+            value = compute(*args)
+            size = artifact_size(value)
+            with _lock:
+                _store(key, value, size)
+            result = value
+        finally:
+            with _lock:
+                del _in_flight[key]
+            future.set_result(result)
+        return value
+
+
+# Function to return a cached artifact without computing it (None when it is not cached)
+def peek_artifact(key):
+    with _lock:
+        if key in _entries:
+            _entries.move_to_end(key)
+            return _entries[key][0]
+    return None
+
+
+# Function to add an artifact that was built elsewhere (e.g. a frame extended by an append)
+def put_artifact(key, value):
+    size = artifact_size(value)
+    with _lock:
+        if key in _entries:
+            _stats['bytes'] -= _entries.pop(key)[1]
+        _store(key, value, size)
+
+
+# Function to drop cached artifacts, either all of them or those whose key starts with a given name
+def clear_artifacts(name=None):
+    with _lock:
+        for key in [key for key in _entries if name is None or key[0] == name]:
+            _stats['bytes'] -= _entries.pop(key)[1]
+
+
+# Function to report how full the cache is and how often it was hit
+def cache_stats():
+    with _lock:
+        return dict(_stats, entries=len(_entries), limit=memory_limit)
@@ -0,0 +1,122 @@
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from shared_cache import get_artifact
+
+# Bootstrap runs are fitted in batches on every core; after each batch the runs stop once the standard error
+# of every cluster's mean Jaccard and of the mean ARI is below the tolerance (about +/-0.05 at 95%)
+min_runs = 20
+convergence_tolerance = 0.025
+
+# Ward linkage needs memory quadratic in the rows, so its resamples draw at most this many rows
+hierarchical_resample_rows = 4000
+
+# Clusters whose mean Jaccard similarity stays above these levels are usually called stable / patterns
+stable_jaccard = 0.75
+pattern_jaccard = 0.6
+
+
+# Function to fit the chosen algorithm on a bootstrap resample and compare it with the reference clusters
+def _bootstrap_run(features, reference, algorithm, n_clusters, seed, resample_rows):
+    from scipy.optimize import linear_sum_assignment
+    from sklearn.metrics import adjusted_rand_score
+
+    rng = np.random.default_rng(seed)
+    rows = rng.integers(0, len(features), size=resample_rows)
+    if algorithm == 'k-means':
+        from sklearn.cluster import KMeans
+        labels = KMeans(n_clusters=n_clusters, random_state=seed).fit(features[rows]).labels_
+    else:
+        from sklearn.cluster import AgglomerativeClustering
+        labels = AgglomerativeClustering(n_clusters=n_clusters, linkage='ward').fit(features[rows]).labels_
+
+    # Rows drawn more than once are counted once when the clusterings are compared
+    rows, first = np.unique(rows, return_index=True)
+    labels, reference = labels[first], reference[rows]
+    contingency = np.bincount(reference * n_clusters + labels, minlength=n_clusters * n_clusters)
+    contingency = contingency.reshape(n_clusters, n_clusters)
+    union = contingency.sum(axis=1)[:, None] + contingency.sum(axis=0)[None, :] - contingency
+    jaccard = contingency / np.maximum(union, 1)
+
+    # Resample clusters get arbitrary numbers, so they are matched to the reference ones first
+    matched_reference, matched_run = linear_sum_assignment(jaccard, maximize=True)
+    similarity = np.full(n_clusters, np.nan)
+    present = contingency.sum(axis=1) > 0
+    similarity[present] = 0.0
+    similarity[matched_reference] = np.where(present[matched_reference], jaccard[matched_reference, matched_run], np.nan)
+    return similarity, adjusted_rand_score(reference, labels)
+
+
+# Function to check whether the mean Jaccard of every cluster and the mean ARI are known precisely enough
+def _converged(jaccard, ari):
+    runs = len(ari)
+    if runs < min_runs:
+        return False
+    errors = np.nanstd(np.vstack([jaccard.T, ari]), axis=1, ddof=1) / np.sqrt(runs)
+    return bool(np.nanmax(errors) < convergence_tolerance)
+
+
+# Function to refit the algorithm on bootstrap resamples in parallel, optionally stopping once the estimates converge
+def bootstrap_stability(features, reference, algorithm, n_clusters, max_runs, early_stop=True):
+    from joblib import Parallel, delayed, cpu_count
+
+    features = np.ascontiguousarray(features, dtype=float)
+    reference = np.asarray(reference)
+    resample_rows = len(features) if algorithm == 'k-means' else min(len(features), hierarchical_resample_rows)
+    batch_size = max(cpu_count(), 5) if early_stop else max_runs
+
+    jaccard, ari = [], []
+    with Parallel(n_jobs=-1) as parallel:
+        while len(ari) < max_runs:
+            seeds = range(len(ari), min(len(ari) + batch_size, max_runs))
+            for similarity, score in parallel(
+                    delayed(_bootstrap_run)(features, reference, algorithm, n_clusters, seed, resample_rows)
+                    for seed in seeds):
+                jaccard.append(similarity)
+                ari.append(score)
+            if early_stop and _converged(np.array(jaccard), np.array(ari)):
+                break
+    jaccard, ari = np.array(jaccard), np.array(ari)
+    return {
+        'jaccard': jaccard,
+        'ari': ari,
+        'runs': len(ari),
+        'converged': _converged(jaccard, ari),
+        'resample_rows': resample_rows,
+    }
+
+
+# Function to run the stability analysis once per dataset, model and settings, shared by every session
+def get_stability(key, features, reference, algorithm, n_clusters, max_runs, early_stop):
+    with st.spinner("Refitting the clusters on bootstrap resamples..."):
+        return get_artifact(key, bootstrap_stability, features, reference, algorithm, n_clusters, max_runs, early_stop)
+
+
+# Function to summarise the per-cluster Jaccard similarities of a stability analysis
+def stability_summary(stability, reference):
+    jaccard = stability['jaccard']
+    sizes = np.bincount(np.asarray(reference), minlength=jaccard.shape[1])
+    mean = np.nanmean(jaccard, axis=0)
+    return pd.DataFrame({
+        'Cluster': np.arange(jaccard.shape[1]),
+        'Size': sizes,
+        'Mean Jaccard': mean.round(3),
+        'Lowest 5% Jaccard': np.nanpercentile(jaccard, 5, axis=0).round(3),
+        'Dissolved Runs (%)': (np.nanmean(np.where(np.isnan(jaccard), np.nan, jaccard < 0.5), axis=0) * 100).round(1),
+        'Assessment': np.where(mean >= stable_jaccard, 'Stable',
+                               np.where(mean >= pattern_jaccard, 'Pattern, not well defined', 'Unstable')),
+    })
+
+
+# Function to show the stability options before a clustering is run
+def stability_settings():
+    check = st.checkbox(
+        "Check cluster stability",
+        help="Refits the model on bootstrap resamples with different seeds and measures how often each cluster comes back.",
+    )
+    if not check:
+        return 0, False
+    max_runs = st.slider("Bootstrap runs:", min_value=10, max_value=200, value=50, step=10)
+    early_stop = st.checkbox("Stop early once the estimates converge", value=True)
+    return max_runs, early_stop
@@ -0,0 +1,75 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('streamlit')
+
+import incremental
+from incremental import append_rows
+from shared_cache import clear_artifacts
+
+
+# Function to build a small review dataset with integer columns
+def reviews(rows):
+    return pd.DataFrame({
+        'Clothing ID': np.arange(rows) % 40,
+        'Age': 20 + np.arange(rows) % 50,
+        'Review Text': [f"Review number {i}" for i in range(rows)],
+        'Rating': 1 + np.arange(rows) % 5,
+        'Positive Feedback Count': np.arange(rows) % 7,
+    })
+
+
+# Function to read a frame back as pandas would read an uploaded CSV
+def round_trip(frame, path):
+    frame.to_csv(path, index=False)
+    return pd.read_csv(path)
+
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    # Outside a Streamlit session the uploads go to the 'default' workspace under the working directory
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(incremental, '_lineage', None)
+    clear_artifacts()
+    folder = os.path.join('uploaded_files', 'workspaces', 'default')
+    os.makedirs(folder)
+    yield folder
+    clear_artifacts()
+
+
+def test_reexport_with_a_missing_value_only_appends_the_changed_row(workspace, tmp_path):
+    data = reviews(300)
+    data.to_csv(os.path.join(workspace, 'reviews.csv'), index=False)
+    export = data.iloc[:200].copy()
+    export.loc[10, 'Positive Feedback Count'] = np.nan
+    export = round_trip(export, tmp_path / 'export.csv')
+    assert export['Positive Feedback Count'].dtype == 'float64'
+
+    path, added, skipped = append_rows(export, 'reviews.csv')
+    assert (added, skipped) == (1, 199)
+    assert len(pd.read_csv(path)) == 301
+
+
+def test_reexport_read_as_int_matches_float_dataset(workspace, tmp_path):
+    data = reviews(300)
+    # One missing value makes pandas read the dataset's column as float
+    data.loc[250, 'Positive Feedback Count'] = np.nan
+    data.to_csv(os.path.join(workspace, 'reviews.csv'), index=False)
+    export = round_trip(reviews(200), tmp_path / 'export.csv')
+    assert export['Positive Feedback Count'].dtype == 'int64'
+
+    path, added, skipped = append_rows(export, 'reviews.csv')
+    assert (added, skipped) == (0, 200)
+
+
+def test_new_rows_keep_the_dataset_types(workspace, tmp_path):
+    data = reviews(300)
+    data.to_csv(os.path.join(workspace, 'reviews.csv'), index=False)
+    export = round_trip(reviews(320).astype({'Rating': 'float64'}), tmp_path / 'export.csv')
+
+    path, added, skipped = append_rows(export, 'reviews.csv')
+    assert (added, skipped) == (20, 300)
+    assert pd.read_csv(path)['Rating'].dtype == 'int64'
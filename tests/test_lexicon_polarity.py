@@ -0,0 +1,81 @@
+import pandas as pd
+import pytest
+
+pytest.importorskip('textblob')
+
+from textblob import TextBlob
+
+from lexicon_polarity import score_lexicon
+
+# Reviews covering the rules the lexicon engine reimplements from TextBlob's pattern analyzer
+corpus = [
+    # Plain lexicon words and unknown words
+    "Great dress, lovely fabric.",
+    "The zipper broke on the first day.",
+    "",
+    "12345",
+    # Negation
+    "Not good at all.",
+    "This is not bad.",
+    "I don't love it and it isn't flattering.",
+    "Never a bad word about this brand.",
+    "No, not good, not bad, just okay.",
+    # Intensifiers, including "-ly" modifiers and negations after them
+    "Very good quality.",
+    "Really not good.",
+    "Extremely disappointed, very very poor.",
+    "Absolutely perfect fit, incredibly soft.",
+    "Slightly too big but really cute.",
+    # Exclamation marks
+    "Love it!",
+    "Love it!!!",
+    "So cute! Terrible zipper though!",
+    "Beautiful! Really!",
+    # Emoticons and sarcasm
+    "Great fit :)",
+    "Bad quality :(",
+    "Perfect :-) nice colour ;)",
+    "Love it <3",
+    "I like it :p.",
+    "Great fit :D.",
+    "Great fit :D",
+    "Fits well xD.",
+    "Oh great (!) another hole.",
+    # Abbreviations, ellipses, quotes and line breaks
+    "Mr. Smith says it's nice, e.g. for work.",
+    "The U.S. sizing is odd... but good.",
+    "Well... \"amazing\" is a stretch.",
+    "Good top.\n\nBad pants.",
+    "GREAT!! DON'T MISS IT.",
+    # Control characters must not split a review or leak into the next one
+    "Soft\x01fabric :)",
+]
+
+
+# Function to score a text with TextBlob itself
+def textblob_scores(text):
+    sentiment = TextBlob(text).sentiment
+    return sentiment.polarity, sentiment.subjectivity
+
+
+@pytest.mark.parametrize('text', corpus)
+def test_matches_textblob(text):
+    scores = score_lexicon(pd.Series([text])).iloc[0]
+    polarity, subjectivity = textblob_scores(text)
+    assert scores['polarity'] == pytest.approx(polarity, abs=1e-9)
+    assert scores['subjectivity'] == pytest.approx(subjectivity, abs=1e-9)
+
+
+def test_reviews_are_scored_independently_in_one_batch():
+    # Negations, modifiers and "!" must not carry over from one review to the next
+    texts = pd.Series(corpus, index=range(100, 100 + len(corpus)))
+    scores = score_lexicon(texts)
+    assert list(scores.index) == list(texts.index)
+    expected = pd.DataFrame([textblob_scores(text) for text in corpus],
+                            columns=['polarity', 'subjectivity'], index=texts.index)
+    pd.testing.assert_frame_equal(scores, expected, atol=1e-9, rtol=0)
+
+
+def test_empty_column():
+    scores = score_lexicon(pd.Series([], dtype=object))
+    assert scores.empty
@@ -0,0 +1,69 @@
+import threading
+
+import pytest
+
+import shared_cache
+from shared_cache import get_artifact, clear_artifacts
+
+
+# An object whose size cannot be measured (reading its attributes fails)
+class Unmeasurable:
+    @property
+    def __dict__(self):
+        raise RecursionError("cyclic model")
+
+
+# Function to ask for an artifact from another thread, as a second session would
+def request_in_thread(key, compute):
+    result = {}
+
+    def request():
+        try:
+            result['value'] = get_artifact(key, compute)
+        except Exception as error:
+            result['error'] = error
+
+    thread = threading.Thread(target=request)
+    thread.start()
+    return thread, result
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    clear_artifacts()
+    yield
+    clear_artifacts()
+
+
+def test_failed_computation_releases_waiting_sessions():
+    started, release = threading.Event(), threading.Event()
+
+    def failing():
+        started.set()
+        release.wait()
+        raise ValueError("bad data")
+
+    owner, owner_result = request_in_thread(('test', 'fail'), failing)
+    started.wait(5)
+    waiter, waiter_result = request_in_thread(('test', 'fail'), lambda: 'retried')
+    release.set()
+    owner.join(5)
+    waiter.join(5)
+    assert not waiter.is_alive()
+    assert isinstance(owner_result['error'], ValueError)
+    assert waiter_result['value'] == 'retried'
+    assert ('test', 'fail') not in shared_cache._in_flight
+
+
+def test_unmeasurable_artifact_does_not_block_the_key():
+    with pytest.raises(RecursionError):
+        get_artifact(('test', 'size'), Unmeasurable)
+    assert ('test', 'size') not in shared_cache._in_flight
+    assert get_artifact(('test', 'size'), lambda: 'measured') == 'measured'
+
+
+def test_artifact_is_computed_once():
+    calls = []
+    for _ in range(3):
+        assert get_artifact(('test', 'once'), lambda: calls.append(1) or len(calls)) == 1
+    assert len(calls) == 1
@@ -0,0 +1,46 @@
+import numpy as np
+import scipy.sparse as sp
+import streamlit as st
+
+from shared_cache import get_artifact
+
+# Hashed vocabulary size: memory stays bounded however many distinct words the reviews use
+n_hash_features = 2 ** 18
+
+# Reviews vectorized per chunk, and the number of text dimensions kept after SVD
+chunk_size = 50000
+n_text_components = 50
+
+
+# Function to turn reviews into a sparse matrix of hashed word and bigram counts, chunk by chunk
+def hashed_term_counts(texts, chunk_size=chunk_size):
+    from sklearn.feature_extraction.text import HashingVectorizer
+    vectorizer = HashingVectorizer(n_features=n_hash_features, ngram_range=(1, 2), stop_words='english',
+                                   alternate_sign=False, norm=None, dtype=np.float32)
+    texts = texts.fillna('').astype(str)
+    chunks = [vectorizer.transform(texts.iloc[start:start + chunk_size]) for start in range(0, len(texts), chunk_size)]
+    return sp.vstack(chunks, format='csr')
+
+
+# Function to reduce the sparse TF-IDF matrix of the reviews to a few dense components
+def text_components(texts, n_components=n_text_components, random_state=0):
+    from sklearn.decomposition import TruncatedSVD
+    from sklearn.feature_extraction.text import TfidfTransformer
+    tfidf = TfidfTransformer(sublinear_tf=True).fit_transform(hashed_term_counts(texts))
+    n_components = min(n_components, tfidf.shape[0] - 1, tfidf.shape[1] - 1)
+    svd = TruncatedSVD(n_components=n_components, algorithm='randomized', random_state=random_state)
+    return svd.fit_transform(tfidf).astype(np.float32)
+
+
+# Function to append text components to scaled numeric features with equal total weight for both blocks
+def combine_features(features_scaled, components):
+    text_variance = components.var(axis=0).sum()
+    if text_variance > 0:
+        components = components * np.sqrt(features_scaled.shape[1] / text_variance)
+    return np.hstack([features_scaled.astype(np.float32), components])
+
+
+# Function to compute the text components once per dataset version and share them across sessions
+def get_text_components(version, texts):
+    with st.spinner("Vectorizing review text..."):
+        return get_artifact(('text_components', version), text_components, texts)
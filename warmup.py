@@ -0,0 +1,93 @@
+import importlib
+import os
+import threading
+import time
+
+import numpy as np
+
+from data_loader import load_uploaded_data, latest_upload_folder
+from review_index import load_review_index
+from phrase_mining import count_phrases
+from segmentation import model_key, get_elbow_sweep
+from sentiment_scoring import sentiment_engines, get_polarity, get_executor, _score_chunk
+from shared_cache import get_artifact
+
+# Set APP_WARMUP=1 to warm the server in the background when the first session opens the app
+warmup_enabled = os.environ.get('APP_WARMUP', '').lower() in ('1', 'true', 'yes')
+
+# Libraries the pages import lazily, loaded ahead of time by the warm-up
+heavy_modules = [
+    'sklearn.preprocessing',
+    'sklearn.cluster',
+    'sklearn.decomposition',
+    'sklearn.metrics',
+    'sklearn.feature_extraction.text',
+    'scipy.cluster.hierarchy',
+    'scipy.sparse.csgraph',
+    'plotly.figure_factory',
+    'textblob',
+    'statsmodels.api',
+]
+
+_started = False
+_lock = threading.Lock()
+
+
+# Function to import the heavy libraries so no page pays for them on its first run
+def preimport(modules=heavy_modules):
+    timings = {}
+    for module in modules:
+        start = time.perf_counter()
+        try:
+            importlib.import_module(module)
+        except ImportError:
+            continue
+        timings[module] = time.perf_counter() - start
+    return timings
+
+
+# Function to compute the artifacts the pages open with for a dataset (by default the latest upload)
+def prime_caches(folder=None):
+    folder = folder or latest_upload_folder()
+    if folder is None:
+        return None
+    data, version = load_uploaded_data(folder)
+    if data is None:
+        return None
+
+    # Same keys the pages use, so their first run is a cache hit
+    get_artifact(('review_index', version), load_review_index, version, data)
+    get_artifact(('phrase_counts', version), count_phrases, data['Review Text'])
+    get_polarity(version, data['Review Text'], sentiment_engines[0])
+    get_elbow_sweep(model_key('elbow', version, False, False), lambda: data.select_dtypes(include=[np.number]))
+
+    # Start the sentiment workers so a new upload is scored without the pool start-up
+    get_executor().submit(_score_chunk, ["warm"]).result()
+    return version
+
+
+# Function to run the whole warm-up, reporting how long each step took
+def warm_up(folder=None):
+    start = time.perf_counter()
+    timings = preimport()
+    version = prime_caches(folder)
+    return {'imports': timings, 'version': version, 'seconds': time.perf_counter() - start}
+
+
+# Function to start the warm-up once per server process in a background thread
+def start_warmup():
+    global _started
+    with _lock:
+        if _started:
+            return False
+        _started = True
+    threading.Thread(target=warm_up, name='app-warmup', daemon=True).start()
+    return True
+
+
+if __name__ == "__main__":
+    # Run ahead of the server to build the on-disk review index and polarity cache for the latest upload
+    report = warm_up()
+    for module, seconds in report['imports'].items():
+        print(f"{module:35s} {seconds:6.2f}s")
+    print(f"Dataset version: {report['version']}, total {report['seconds']:.1f}s")